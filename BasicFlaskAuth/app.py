@@ -1,8 +1,9 @@
 from flask import Flask, request, abort
-import json
 from functools import wraps
 from jose import jwt
-from urllib.request import urlopen
+
+from jwks import JWKSError, JWKSKeyStore, url_source
+from token_cache import TokenCache
 
 
 app = Flask(__name__)
@@ -11,6 +12,15 @@ AUTH0_DOMAIN = @TODO_REPLACE_WITH_YOUR_DOMAIN
 ALGORITHMS = ['RS256']
 API_AUDIENCE = @TODO_REPLACE_WITH_YOUR_API_AUDIENCE
 
+# Signing keys by kid, fetched once and refreshed in the background.
+jwks = JWKSKeyStore(url_source(f'https://{AUTH0_DOMAIN}/.well-known/jwks.json'))
+
+# Payloads of verified tokens, kept at most TOKEN_CACHE_MAX_AGE seconds.
+# A TOKEN_CACHE_SIZE of 0 verifies every token on every request.
+TOKEN_CACHE_SIZE = 1024
+TOKEN_CACHE_MAX_AGE = 300
+verified_tokens = TokenCache(TOKEN_CACHE_SIZE, TOKEN_CACHE_MAX_AGE)
+
 
 class AuthError(Exception):
     def __init__(self, error, status_code):
@@ -52,25 +62,21 @@ def get_token_auth_header():
 
 
 def verify_decode_jwt(token):
-    jsonurl = urlopen(f'https://{AUTH0_DOMAIN}/.well-known/jwks.json')
-    jwks = json.loads(jsonurl.read())
     unverified_header = jwt.get_unverified_header(token)
-    rsa_key = {}
     if 'kid' not in unverified_header:
         raise AuthError({
             'code': 'invalid_header',
             'description': 'Authorization malformed.'
         }, 401)
 
-    for key in jwks['keys']:
-        if key['kid'] == unverified_header['kid']:
-            rsa_key = {
-                'kty': key['kty'],
-                'kid': key['kid'],
-                'use': key['use'],
-                'n': key['n'],
-                'e': key['e']
-            }
+    try:
+        rsa_key = jwks.get_key(unverified_header['kid'])
+    except JWKSError:
+        raise AuthError({
+            'code': 'jwks_unavailable',
+            'description': 'Unable to fetch the signing keys.'
+        }, 503)
+
     if rsa_key:
         try:
             payload = jwt.decode(
@@ -109,10 +115,13 @@ def requires_auth(f):
     @wraps(f)
     def wrapper(*args, **kwargs):
         token = get_token_auth_header()
-        try:
-            payload = verify_decode_jwt(token)
-        except:
-            abort(401)
+        payload = verified_tokens.get(token)
+        if payload is None:
+            try:
+                payload = verify_decode_jwt(token)
+            except:
+                abort(401)
+            verified_tokens.set(token, payload)
         return f(payload, *args, **kwargs)
 
     return wrapper
@@ -0,0 +1,136 @@
+"""
+A cache of the JSON Web Key Set (JWKS) tokens are verified against.
+
+Fetching the key set from the identity provider on every request puts a TLS
+round trip in front of every protected route, and makes every hiccup of the
+provider an outage. JWKSKeyStore keeps the keys by kid instead:
+
+- keys are refreshed in a background thread once they are older than
+  refresh_after, while the cached keys keep being served;
+- keys older than ttl are refreshed before being served;
+- an unknown kid, e.g. after the provider rotated its keys, triggers a
+  refetch, at most once every min_refetch_interval seconds;
+- if a refresh fails, the last keys fetched keep being served.
+
+The source is any callable returning the key set as a dict, so the store can
+be pointed at a URL, a local file or a stub.
+
+Vendored from the coffee shop backend, whose
+projects/03_coffee_shop_full_stack/starter_code/backend/src/auth/jwks.py is
+the canonical, tested copy. BasicFlaskAuth is a standalone app, so the
+module is copied rather than imported: make changes there and copy them
+here.
+"""
+import json
+import logging
+import threading
+import time
+from urllib.request import urlopen
+
+logger = logging.getLogger(__name__)
+
+
+class JWKSError(Exception):
+    """Raised when the key set cannot be fetched and no keys are cached."""
+
+
+def url_source(url, timeout=5):
+    """Returns a source fetching the key set from url."""
+    def fetch():
+        with urlopen(url, timeout=timeout) as response:
+            return json.loads(response.read())
+
+    return fetch
+
+
+def file_source(path):
+    """Returns a source reading the key set from a JSON file."""
+    def fetch():
+        with open(path) as f:
+            return json.load(f)
+
+    return fetch
+
+
+class JWKSKeyStore:
+    """Caches the keys of a key set by kid, as described above."""
+
+    def __init__(self, source, ttl=3600, refresh_after=None,
+                 min_refetch_interval=30, clock=time.monotonic):
+        self.source = source
+        self.ttl = ttl
+        self.refresh_after = ttl * 0.8 if refresh_after is None else refresh_after
+        self.min_refetch_interval = min_refetch_interval
+        self._clock = clock
+        self._lock = threading.Lock()
+        # (fetched at, keys by kid), replaced as a whole so readers never see
+        # keys without the time they were fetched.
+        self._fetched = None
+        self._attempted_at = None
+        self._refreshing = False
+
+    def get_key(self, kid):
+        """Returns the key with the given kid, as published in the key set, or
+        None if the key set has no such key.
+
+        Raises JWKSError if no keys could ever be fetched.
+        """
+        now = self._clock()
+        fetched = self._fetched
+        if fetched is None or now - fetched[0] >= self.ttl:
+            keys = self._fetch(now)
+        elif kid not in fetched[1]:
+            # The keys may have been rotated since they were fetched.
+            keys = self._fetch(now)
+        else:
+            keys = fetched[1]
+            if now - fetched[0] >= self.refresh_after:
+                self._refresh_in_background(now)
+        return keys.get(kid)
+
+    def refresh(self):
+        """Fetches the key set now, whatever the rate limit. Returns whether
+        the keys were fetched.
+        """
+        with self._lock:
+            return self._fetch_locked(self._clock())
+
+    def _fetch(self, now):
+        with self._lock:
+            # Another thread may have fetched the keys while this one waited.
+            if not self._recently_attempted(now):
+                self._fetch_locked(now)
+            if self._fetched is None:
+                raise JWKSError('Unable to fetch the JSON Web Key Set.')
+            return self._fetched[1]
+
+    def _recently_attempted(self, now):
+        return (self._attempted_at is not None
+                and now - self._attempted_at < self.min_refetch_interval)
+
+    def _fetch_locked(self, now):
+        self._attempted_at = now
+        try:
+            jwks = self.source()
+            keys = {key['kid']: key for key in jwks['keys'] if 'kid' in key}
+        except Exception:
+            logger.exception('Unable to fetch the JSON Web Key Set')
+            return False
+
+        self._fetched = (self._clock(), keys)
+        return True
+
+    def _refresh_in_background(self, now):
+        with self._lock:
+            if self._refreshing or self._recently_attempted(now):
+                return
+            self._refreshing = True
+
+        def refresh():
+            try:
+                with self._lock:
+                    self._fetch_locked(self._clock())
+            finally:
+                self._refreshing = False
+
+        threading.Thread(target=refresh, daemon=True).start()
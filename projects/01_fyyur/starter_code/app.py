@@ -2,9 +2,10 @@
 # Imports
 # ----------------------------------------------------------------------------#
 
+import base64
 import json
-import dateutil.parser
-import babel
+import time
+import click
 from flask import (
     Flask,
     render_template,
@@ -19,12 +20,18 @@ from flask import (
 from flask_moment import Moment
 from flask_sqlalchemy import SQLAlchemy
 import sqlalchemy.sql.functions as func
+from sqlalchemy import case, event, literal, or_, tuple_
 from flask_migrate import Migrate
 import logging
 from logging import Formatter, FileHandler
 from flask_wtf import Form
 from forms import *
+from collections import defaultdict
 from datetime import datetime, timezone
+from itertools import groupby
+from formatting import format_datetime
+from importer import BulkImporter, FILE_FORMATS, IMPORT_KINDS, guess_format, read_rows
+from search import TrigramIndex
 import sys
 
 # ----------------------------------------------------------------------------#
@@ -89,6 +96,13 @@ class Show(db.Model):
         ),
     )
 
+    # The primary key already covers lookups by artist_id. These cover lookups
+    # by venue and time range, and the upcoming show scan across all venues.
+    __table_args__ = (
+        db.Index("ix_shows_venue_id_start_time", "venue_id", "start_time"),
+        db.Index("ix_shows_start_time", "start_time"),
+    )
+
 
 class Artist(db.Model):
     __tablename__ = "artists"
@@ -118,6 +132,15 @@ class Artist(db.Model):
         "Genre", secondary=artists_genres, backref=db.backref("artists", lazy=True)
     )
 
+    __table_args__ = (
+        db.Index(
+            "ix_artists_name_trgm",
+            "name",
+            postgresql_using="gin",
+            postgresql_ops={"name": "gin_trgm_ops"},
+        ),
+    )
+
 
 class Venue(db.Model):
     __tablename__ = "venues"
@@ -142,12 +165,21 @@ class Venue(db.Model):
         "Genre", secondary=venues_genres, backref=db.backref("venues", lazy=True)
     )
 
+    __table_args__ = (
+        db.Index(
+            "ix_venues_name_trgm",
+            "name",
+            postgresql_using="gin",
+            postgresql_ops={"name": "gin_trgm_ops"},
+        ),
+    )
+
 
 class Genre(db.Model):
     __tablename__ = "genres"
 
     id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String(50), nullable=False)
+    name = db.Column(db.String(50), nullable=False, index=True)
 
 
 # ----------------------------------------------------------------------------#
@@ -155,15 +187,6 @@ class Genre(db.Model):
 # ----------------------------------------------------------------------------#
 
 
-def format_datetime(value, format="medium"):
-    date = dateutil.parser.parse(value)
-    if format == "full":
-        format = "EEEE MMMM, d, y 'at' h:mma"
-    elif format == "medium":
-        format = "EE MM, dd, y h:mma"
-    return babel.dates.format_datetime(date, format)
-
-
 app.jinja_env.filters["datetime"] = format_datetime
 
 
@@ -172,26 +195,78 @@ app.jinja_env.filters["datetime"] = format_datetime
 # ----------------------------------------------------------------------------#
 
 
-def build_choices_from_query(query):
+# (loaded at, (id, name) choices) for form dropdowns, cached per model until its
+# rows change in this process, or for at most CHOICES_MAX_AGE seconds.
+choices_cache = {}
+choices_versions = defaultdict(int)
+
+
+def get_choices(model, max_age=None):
     """
     Build id and name pairs for form validation.
 
     We need this to dynamically load options from the database into the frontend.
+    The pairs are cached per model, so rendering a form does not query the
+    database again until a row of that model is inserted, updated or deleted.
+    Other processes, like other app workers or the import command, cannot
+    invalidate the cache, so entries are also reloaded once they are older than
+    max_age seconds, CHOICES_MAX_AGE by default. Form submissions pass 0 to
+    validate against the current rows.
     """
-    choices = []
-    for result in query:
-        choice = (result.id, result.name)
-        choices.append(choice)
+    if max_age is None:
+        max_age = app.config["CHOICES_MAX_AGE"]
+    now = time.monotonic()
+    cached = choices_cache.get(model)
+    if cached is not None and now - cached[0] < max_age:
+        return cached[1]
+
+    version = choices_versions[model]
+    choices = tuple(
+        (row.id, row.name)
+        for row in db.session.query(model.id, model.name).order_by(model.name)
+    )
+    # Only cache the choices if no commit invalidated them while loading.
+    if choices_versions[model] == version:
+        choices_cache[model] = (now, choices)
     return choices
 
 
-def add_genres_to_model(genre_ids, model):
+def invalidate_choices(model):
+    choices_versions[model] += 1
+    choices_cache.pop(model, None)
+
+
+@event.listens_for(db.session, "after_flush")
+def record_choice_changes(session, flush_context):
+    changed = session.info.setdefault("changed_choices", set())
+    for instance in session.new | session.dirty | session.deleted:
+        changed.add(type(instance))
+
+
+@event.listens_for(db.session, "after_commit")
+def apply_choice_changes(session):
+    for model in session.info.pop("changed_choices", ()):
+        invalidate_choices(model)
+
+
+@event.listens_for(db.session, "after_rollback")
+def discard_choice_changes(session):
+    session.info.pop("changed_choices", None)
+
+
+def set_model_genres(genre_ids, model):
     """
-    Loads genres by ID and associates them with a model.
+    Loads genres by ID and makes them the genres of a model.
+
+    All genres are loaded with one IN query. Assigning them to the relationship
+    lets SQLAlchemy diff them against the existing associations, so the flush
+    only deletes removed genres and inserts new ones, each as one executemany.
     """
-    for genre_id in genre_ids:
-        genre = Genre.query.get(genre_id)
-        model.genres.append(genre)
+    genre_ids = {int(genre_id) for genre_id in genre_ids}
+    genres = []
+    if genre_ids:
+        genres = Genre.query.filter(Genre.id.in_(genre_ids)).all()
+    model.genres = genres
 
 
 def build_venue_from_form(venue_form, venue):
@@ -209,7 +284,7 @@ def build_venue_from_form(venue_form, venue):
         venue.image_link = venue_form["image_link"]
 
     genre_ids = venue_form.getlist("genres")
-    add_genres_to_model(genre_ids, venue)
+    set_model_genres(genre_ids, venue)
     return venue
 
 
@@ -227,7 +302,7 @@ def build_artist_from_form(artist_form, artist):
         artist.image_link = artist_form["image_link"]
 
     genre_ids = artist_form.getlist("genres")
-    add_genres_to_model(genre_ids, artist)
+    set_model_genres(genre_ids, artist)
     return artist
 
 
@@ -238,37 +313,181 @@ def flash_form_errors(form, message):
             flash(err)
 
 
+def get_current_time():
+    """
+    The time shows are split into past and upcoming by, as an aware UTC datetime.
+
+    Listing, search and detail pages all compare against it, so their upcoming
+    show counts agree.
+    """
+    return datetime.now(timezone.utc)
+
+
+def get_page_size():
+    """
+    Reads the requested page size, falling back to PAGE_SIZE and capped at MAX_PAGE_SIZE.
+    """
+    page_size = request.values.get("page_size", app.config["PAGE_SIZE"], type=int)
+    return max(1, min(page_size, app.config["MAX_PAGE_SIZE"]))
+
+
+def encode_cursor(row, sort_columns):
+    """
+    Encodes the sort key of the last row on a page as an opaque, URL-safe token.
+    """
+    key = []
+    for column in sort_columns:
+        value = getattr(row, column.key)
+        if isinstance(value, datetime):
+            value = value.isoformat()
+        key.append(value)
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode().rstrip("=")
+
+
+def decode_cursor(token, sort_columns):
+    """
+    Decodes a page token back into sort key values.
+
+    A missing token starts from the first page. A malformed token, or one whose
+    values do not match the types of the sort columns, aborts with 400 rather
+    than reaching the database.
+    """
+    if not token:
+        return None
+    try:
+        padding = "=" * (-len(token) % 4)
+        key = json.loads(base64.urlsafe_b64decode(token + padding))
+        if not isinstance(key, list) or len(key) != len(sort_columns):
+            raise ValueError("cursor does not match the sort key")
+        return [
+            decode_cursor_value(column, value)
+            for column, value in zip(sort_columns, key)
+        ]
+    except (ValueError, TypeError):
+        abort(400)
+
+
+def decode_cursor_value(column, value):
+    """
+    Checks a decoded cursor value against the type of its sort column.
+
+    Raises TypeError or ValueError when the value cannot be compared with the
+    column, e.g. a number for a text column.
+    """
+    column_type = column.type
+    if isinstance(column_type, db.DateTime):
+        if not isinstance(value, str):
+            raise TypeError(f"expected a timestamp for {column.key}")
+        return datetime.fromisoformat(value)
+
+    if isinstance(value, bool):
+        raise TypeError(f"unexpected boolean for {column.key}")
+    if isinstance(column_type, db.String):
+        expected = str
+    elif isinstance(column_type, db.Integer):
+        expected = int
+    else:
+        # Computed sort keys, like search distances, are numbers.
+        expected = (int, float)
+    if not isinstance(value, expected):
+        raise TypeError(f"unexpected {type(value).__name__} for {column.key}")
+    return value
+
+
+def paginate_by_keyset(query, sort_columns, cursor, page_size):
+    """
+    Returns one page of rows ordered by sort_columns and the token for the next page.
+
+    Rows are selected with a row value comparison against the sort key of the
+    previous page's last row, so the database seeks straight to the page through
+    an index and deep pages cost the same as the first one. One extra row is
+    fetched to find out whether there is a next page.
+    """
+    if cursor is not None:
+        cursor_key = tuple_(
+            *[
+                literal(value, column.type)
+                for column, value in zip(sort_columns, cursor)
+            ]
+        )
+        query = query.filter(tuple_(*sort_columns) > cursor_key)
+
+    rows = query.order_by(*sort_columns).limit(page_size + 1).all()
+
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        next_cursor = encode_cursor(rows[-1], sort_columns)
+    return rows, next_cursor
+
+
 # ----------------------------------------------------------------------------#
 # Venue Repository
 # ----------------------------------------------------------------------------#
 
 
-def get_areas_by_city_state():
-    return (
-        db.session.query(Venue.city, Venue.state)
-        .group_by(Venue.city)
-        .group_by(Venue.state)
-        .order_by(Venue.city)
+def get_venue_listing():
+    """
+    Builds the city/state -> venues -> upcoming show count tree in one query.
+
+    Venues are left joined to their shows so venues without shows are kept,
+    and only upcoming shows are counted. Rows come back ordered by area,
+    so they can be grouped into areas in a single pass.
+    """
+    upcoming_show = case([(Show.start_time > get_current_time(), Show.venue_id)])
+    rows = (
+        db.session.query(
+            Venue.city,
+            Venue.state,
+            Venue.id,
+            Venue.name,
+            func.count(upcoming_show).label("num_upcoming_shows"),
+        )
+        .outerjoin(Show, Show.venue_id == Venue.id)
+        .group_by(Venue.city, Venue.state, Venue.id, Venue.name)
+        .order_by(Venue.city, Venue.state, Venue.name, Venue.id)
         .all()
     )
 
+    areas = []
+    for (city, state), venues in groupby(rows, key=lambda row: (row.city, row.state)):
+        areas.append(
+            {
+                "city": city,
+                "state": state,
+                "venues": [
+                    {
+                        "id": venue.id,
+                        "name": venue.name,
+                        "num_upcoming_shows": venue.num_upcoming_shows,
+                    }
+                    for venue in venues
+                ],
+            }
+        )
+    return areas
 
-def get_venues_in_area(area):
-    return (
-        db.session.query(Venue.id, Venue.name)
-        .filter(Venue.city == area.city)
-        .filter(Venue.state == area.state)
-        .all()
-    )
 
+def get_num_upcoming_shows_by_venues(venue_ids):
+    """
+    Counts upcoming shows for many venues with a single grouped query.
 
-def get_num_upcoming_shows_by_venue(venue):
-    return (
-        db.session.query(Show.venue_id)
-        .filter(Show.venue_id == venue.id)
-        .filter(Show.start_time > datetime.today())
-        .count()
+    Returns a dict of venue id to count. Venues without upcoming shows have no
+    row in the result, so they default to 0.
+    """
+    counts = dict.fromkeys(venue_ids, 0)
+    if not counts:
+        return counts
+
+    rows = (
+        db.session.query(Show.venue_id, func.count(Show.venue_id))
+        .filter(Show.venue_id.in_(list(counts)))
+        .filter(Show.start_time > get_current_time())
+        .group_by(Show.venue_id)
+        .all()
     )
+    counts.update(rows)
+    return counts
 
 
 def get_shows_at_venue(venue):
@@ -282,13 +501,16 @@ def get_shows_at_venue(venue):
 
 
 def build_venue_data_short(venues):
+    venue_ids = [venue.id for venue in venues]
+    num_upcoming_shows = get_num_upcoming_shows_by_venues(venue_ids)
+
     venue_data = []
     for venue in venues:
         venue_data.append(
             {
                 "id": venue.id,
                 "name": venue.name,
-                "num_upcoming_shows": get_num_upcoming_shows_by_venue(venue),
+                "num_upcoming_shows": num_upcoming_shows[venue.id],
             }
         )
     return venue_data
@@ -299,13 +521,29 @@ def build_venue_data_short(venues):
 # ----------------------------------------------------------------------------#
 
 
-def get_num_upcoming_shows_by_artist(artist):
-    return (
-        db.session.query(Show.artist_id)
-        .filter(Show.artist_id == artist.id)
-        .filter(Show.start_time > datetime.today())
-        .count()
+ARTIST_SORT = (Artist.name, Artist.id)
+
+
+def get_num_upcoming_shows_by_artists(artist_ids):
+    """
+    Counts upcoming shows for many artists with a single grouped query.
+
+    Returns a dict of artist id to count. Artists without upcoming shows have no
+    row in the result, so they default to 0.
+    """
+    counts = dict.fromkeys(artist_ids, 0)
+    if not counts:
+        return counts
+
+    rows = (
+        db.session.query(Show.artist_id, func.count(Show.artist_id))
+        .filter(Show.artist_id.in_(list(counts)))
+        .filter(Show.start_time > get_current_time())
+        .group_by(Show.artist_id)
+        .all()
     )
+    counts.update(rows)
+    return counts
 
 
 def get_shows_by_artist(artist):
@@ -317,18 +555,155 @@ def get_shows_by_artist(artist):
 
 
 def build_artist_data_short(artists):
+    artist_ids = [artist.id for artist in artists]
+    num_upcoming_shows = get_num_upcoming_shows_by_artists(artist_ids)
+
     artist_data = []
     for artist in artists:
         artist_data.append(
             {
                 "id": artist.id,
                 "name": artist.name,
-                "num_upcoming_shows": get_num_upcoming_shows_by_artist(artist),
+                "num_upcoming_shows": num_upcoming_shows[artist.id],
             }
         )
     return artist_data
 
 
+# ----------------------------------------------------------------------------#
+# Show Repository
+# ----------------------------------------------------------------------------#
+
+
+def partition_shows(shows_query, past_limit=None):
+    """
+    Splits shows into past and upcoming with a single ordered query.
+
+    Both sides are decided in the database against the same timestamp, so the
+    lists and the counts always agree. Window functions count each side and
+    rank past shows by recency, which lets past_limit keep only the most
+    recent past shows while still reporting how many there are in total. A
+    past_limit of 0 lists no past shows but still counts them.
+
+    Returns (past_shows, upcoming_shows, past_shows_count, upcoming_shows_count),
+    with both lists sorted by start_time.
+    """
+    is_upcoming = Show.start_time > get_current_time()
+    shows = shows_query.add_columns(
+        is_upcoming.label("is_upcoming"),
+        db.func.count().over(partition_by=is_upcoming).label("partition_count"),
+        db.func.row_number()
+        .over(partition_by=is_upcoming, order_by=Show.start_time.desc())
+        .label("recency"),
+    ).subquery()
+
+    query = db.session.query(shows).order_by(shows.c.start_time)
+    if past_limit is not None:
+        past_limit = max(past_limit, 0)
+        # Fetch at least the latest past show, which carries the past count.
+        query = query.filter(
+            or_(shows.c.is_upcoming, shows.c.recency <= max(past_limit, 1))
+        )
+
+    past_shows = []
+    upcoming_shows = []
+    counts = {True: 0, False: 0}
+    for show in query:
+        counts[show.is_upcoming] = show.partition_count
+        if show.is_upcoming:
+            upcoming_shows.append(show)
+        elif past_limit is None or show.recency <= past_limit:
+            past_shows.append(show)
+    return past_shows, upcoming_shows, counts[False], counts[True]
+
+
+# ----------------------------------------------------------------------------#
+# Search Repository
+# ----------------------------------------------------------------------------#
+
+# In-process name indexes, used when the database has no pg_trgm indexes.
+name_indexes = {Venue: TrigramIndex(), Artist: TrigramIndex()}
+
+
+def get_name_index(model):
+    index = name_indexes[model]
+    if not index.loaded:
+        index.load(db.session.query(model.id, model.name))
+    return index
+
+
+def escape_like(term):
+    """Escapes LIKE wildcards in term with backslashes, so it matches literally."""
+    return term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def search_by_name(model, search_term, cursor_token, page_size):
+    """
+    Finds venues or artists whose name contains search_term, best matches first.
+
+    Matches are ranked by trigram similarity to the search term and paginated
+    by (distance, name, id). Postgres answers the search from the pg_trgm GIN
+    index on name; other databases use the in-process trigram index.
+
+    Returns the page of (distance, name, id) rows, the next page token and
+    the total number of matches.
+    """
+    distance = db.func.round(
+        (1 - db.func.similarity(model.name, search_term)) * 1000
+    ).label("distance")
+    sort_columns = (distance, model.name, model.id)
+    cursor = decode_cursor(cursor_token, sort_columns)
+
+    if db.engine.dialect.name == "postgresql":
+        # Match the term literally, as the in-process index does.
+        name_filter = model.name.ilike(f"%{escape_like(search_term)}%", escape="\\")
+        matches = db.session.query(distance, model.name, model.id).filter(name_filter)
+        rows, next_cursor = paginate_by_keyset(matches, sort_columns, cursor, page_size)
+        count = db.session.query(model.id).filter(name_filter).count()
+        return rows, next_cursor, count
+
+    rows, count = get_name_index(model).search(
+        search_term, after=cursor, limit=page_size + 1
+    )
+
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        next_cursor = encode_cursor(rows[-1], sort_columns)
+    return rows, next_cursor, count
+
+
+@event.listens_for(db.session, "after_flush")
+def record_name_changes(session, flush_context):
+    """
+    Remembers flushed venue and artist names until the transaction ends.
+    """
+    changes = session.info.setdefault("name_changes", [])
+    for instance in session.new | session.dirty:
+        if type(instance) in name_indexes:
+            changes.append((type(instance), instance.id, instance.name))
+    for instance in session.deleted:
+        if type(instance) in name_indexes:
+            changes.append((type(instance), instance.id, None))
+
+
+@event.listens_for(db.session, "after_commit")
+def apply_name_changes(session):
+    for model, row_id, name in session.info.pop("name_changes", []):
+        index = name_indexes[model]
+        if not index.loaded:
+            continue
+        if name is None:
+            index.remove(row_id)
+        else:
+            index.add(row_id, name)
+
+
+@event.listens_for(db.session, "after_rollback")
+def discard_name_changes(session):
+    session.info.pop("name_changes", None)
+
+
 # ----------------------------------------------------------------------------#
 # Controllers
 # ----------------------------------------------------------------------------#
@@ -346,8 +721,7 @@ def index():
 
 @app.route("/venues/create", methods=["GET"])
 def create_venue_form():
-    genres = Genre.query.order_by("name").all()
-    genre_choices = build_choices_from_query(genres)
+    genre_choices = get_choices(Genre)
 
     form = VenueForm()
     form.genres.choices = genre_choices
@@ -356,8 +730,7 @@ def create_venue_form():
 
 @app.route("/venues/create", methods=["POST"])
 def create_venue_submission():
-    genres = Genre.query.order_by("name").all()
-    genre_choices = build_choices_from_query(genres)
+    genre_choices = get_choices(Genre, max_age=0)
 
     form = VenueForm()
     form.genres.choices = genre_choices
@@ -392,14 +765,7 @@ def create_venue_submission():
 
 @app.route("/venues", methods=["GET"])
 def venues():
-    areas = get_areas_by_city_state()
-    data = []
-    for area in areas:
-        venues = get_venues_in_area(area)
-        venue_data = build_venue_data_short(venues)
-        data.append(
-            {"city": area.city, "state": area.state, "venues": venue_data,}
-        )
+    data = get_venue_listing()
     return render_template("pages/venues.html", areas=data)
 
 
@@ -409,7 +775,9 @@ def show_venue(venue_id):
     if not venue:
         return render_template("errors/404.html"), 404
 
-    venue_shows = get_shows_at_venue(venue)
+    past, upcoming, past_shows_count, upcoming_shows_count = partition_shows(
+        get_shows_at_venue(venue), app.config["PAST_SHOWS_LIMIT"]
+    )
 
     genre_list = []
     for genre in venue.genres:
@@ -417,22 +785,16 @@ def show_venue(venue_id):
 
     upcoming_shows = []
     past_shows = []
-    for show in venue_shows:
-        show_details = {
-            "artist_id": show.artist_id,
-            "artist_name": show.name,
-            "artist_image_link": show.image_link,
-            "start_time": show.start_time.strftime("%m/%d/%y, %H:%M"),
-        }
-        if show.start_time > datetime.now(timezone.utc):
-            upcoming_shows.append(show_details)
-        else:
-            past_shows.append(show_details)
-
-    past_shows_count = venue_shows.filter(Show.start_time <= datetime.today()).count()
-    upcoming_shows_count = venue_shows.filter(
-        Show.start_time > datetime.today()
-    ).count()
+    for shows, show_list in ((upcoming, upcoming_shows), (past, past_shows)):
+        for show in shows:
+            show_list.append(
+                {
+                    "artist_id": show.artist_id,
+                    "artist_name": show.name,
+                    "artist_image_link": show.image_link,
+                    "start_time": show.start_time,
+                }
+            )
     data = {
         "id": venue.id,
         "name": venue.name,
@@ -462,13 +824,14 @@ def show_venue(venue_id):
 @app.route("/venues/search", methods=["POST"])
 def search_venues():
     search_term = request.form["search_term"]
-    venues = db.session.query(Venue.id, Venue.name).filter(
-        Venue.name.ilike(f"%{search_term}%")
+    venues, next_cursor, count = search_by_name(
+        Venue, search_term, request.form.get("cursor"), get_page_size()
     )
 
     response = {
-        "count": venues.count(),
+        "count": count,
         "data": build_venue_data_short(venues),
+        "next_cursor": next_cursor,
     }
     return render_template(
         "pages/search_venues.html",
@@ -508,16 +871,14 @@ def edit_venue_form(venue_id):
 
     form = VenueForm(data=venue_data)
 
-    genres = Genre.query.order_by("name").all()
-    form.genres.choices = build_choices_from_query(genres)
+    form.genres.choices = get_choices(Genre)
 
     return render_template("forms/edit_venue.html", form=form, venue=venue_data)
 
 
 @app.route("/venues/<int:venue_id>/edit", methods=["POST"])
 def edit_venue_submission(venue_id):
-    genres = Genre.query.order_by("name").all()
-    genre_choices = build_choices_from_query(genres)
+    genre_choices = get_choices(Genre, max_age=0)
 
     form = VenueForm()
     form.genres.choices = genre_choices
@@ -546,11 +907,9 @@ def edit_venue_submission(venue_id):
         venue_query.seeking_talent = data["seeking_talent"] == "True"
         venue_query.image_link = data["image_link"]
 
-        # On edit, genre associations in db are overwritten.
-        # This could cause problems if mult. people edit the same venue at the same time
-        venue_query.genres = []
+        # On edit, only the genre associations that changed are written.
         genres = data.getlist("genres")
-        add_genres_to_model(genres, venue_query)
+        set_model_genres(genres, venue_query)
 
         db.session.commit()
 
@@ -598,8 +957,7 @@ def delete_venue(venue_id):
 
 @app.route("/artists/create", methods=["GET"])
 def create_artist_form():
-    genres = Genre.query.order_by("name").all()
-    genre_choices = build_choices_from_query(genres)
+    genre_choices = get_choices(Genre)
 
     form = ArtistForm()
     form.genres.choices = genre_choices
@@ -608,8 +966,7 @@ def create_artist_form():
 
 @app.route("/artists/create", methods=["POST"])
 def create_artist_submission():
-    genres = Genre.query.order_by("name").all()
-    genre_choices = build_choices_from_query(genres)
+    genre_choices = get_choices(Genre, max_age=0)
 
     form = ArtistForm()
     form.genres.choices = genre_choices
@@ -644,9 +1001,14 @@ def create_artist_submission():
 
 @app.route("/artists")
 def artists():
-    artists = db.session.query(Artist.id, Artist.name).all()
+    cursor = decode_cursor(request.args.get("cursor"), ARTIST_SORT)
+    artists, next_cursor = paginate_by_keyset(
+        db.session.query(Artist.id, Artist.name), ARTIST_SORT, cursor, get_page_size()
+    )
     artist_data = build_artist_data_short(artists)
-    return render_template("pages/artists.html", artists=artist_data)
+    return render_template(
+        "pages/artists.html", artists=artist_data, next_cursor=next_cursor
+    )
 
 
 @app.route("/artists/<int:artist_id>")
@@ -655,7 +1017,9 @@ def show_artist(artist_id):
     if not artist:
         return render_template("errors/404.html"), 404
 
-    artist_shows = get_shows_by_artist(artist)
+    past, upcoming, past_shows_count, upcoming_shows_count = partition_shows(
+        get_shows_by_artist(artist), app.config["PAST_SHOWS_LIMIT"]
+    )
 
     genre_list = []
     for genre in artist.genres:
@@ -663,22 +1027,16 @@ def show_artist(artist_id):
 
     upcoming_shows = []
     past_shows = []
-    for show in artist_shows:
-        show_details = {
-            "venue_id": show.venue_id,
-            "venue_name": show.name,
-            "venue_image_link": show.image_link,
-            "start_time": show.start_time.strftime("%m/%d/%y, %H:%M"),
-        }
-        if show.start_time > datetime.now(timezone.utc):
-            upcoming_shows.append(show_details)
-        else:
-            past_shows.append(show_details)
-
-    past_shows_count = artist_shows.filter(Show.start_time <= datetime.today()).count()
-    upcoming_shows_count = artist_shows.filter(
-        Show.start_time > datetime.today()
-    ).count()
+    for shows, show_list in ((upcoming, upcoming_shows), (past, past_shows)):
+        for show in shows:
+            show_list.append(
+                {
+                    "venue_id": show.venue_id,
+                    "venue_name": show.name,
+                    "venue_image_link": show.image_link,
+                    "start_time": show.start_time,
+                }
+            )
     data = {
         "id": artist.id,
         "name": artist.name,
@@ -707,13 +1065,14 @@ def show_artist(artist_id):
 @app.route("/artists/search", methods=["POST"])
 def search_artists():
     search_term = request.form["search_term"]
-    artists = db.session.query(Artist.id, Artist.name).filter(
-        Artist.name.ilike(f"%{search_term}%")
+    artists, next_cursor, count = search_by_name(
+        Artist, search_term, request.form.get("cursor"), get_page_size()
     )
 
     response = {
-        "count": artists.count(),
+        "count": count,
         "data": build_artist_data_short(artists),
+        "next_cursor": next_cursor,
     }
 
     return render_template(
@@ -755,16 +1114,14 @@ def edit_artist_form(artist_id):
 
     form = ArtistForm(data=artist_data)
 
-    genres = Genre.query.order_by("name").all()
-    form.genres.choices = build_choices_from_query(genres)
+    form.genres.choices = get_choices(Genre)
 
     return render_template("forms/edit_artist.html", form=form, artist=artist_data)
 
 
 @app.route("/artists/<int:artist_id>/edit", methods=["POST"])
 def edit_artist_submission(artist_id):
-    genres = Genre.query.order_by("name").all()
-    genre_choices = build_choices_from_query(genres)
+    genre_choices = get_choices(Genre, max_age=0)
 
     form = ArtistForm()
     form.genres.choices = genre_choices
@@ -792,11 +1149,9 @@ def edit_artist_submission(artist_id):
         artist_query.seeking_venue = data["seeking_venue"] == "True"
         artist_query.image_link = data["image_link"]
 
-        # On edit, genre associations in db are overwritten.
-        # This could cause problems if mult. people edit the same venue at the same time
-        artist_query.genres = []
+        # On edit, only the genre associations that changed are written.
         genres = data.getlist("genres")
-        add_genres_to_model(genres, artist_query)
+        set_model_genres(genres, artist_query)
 
         db.session.commit()
 
@@ -845,11 +1200,8 @@ def create_show_form():
 
     form = ShowForm()
 
-    artists = Artist.query.order_by("name").all()
-    form.artist.choices = build_choices_from_query(artists)
-
-    venues = Venue.query.order_by("name").all()
-    form.venue.choices = build_choices_from_query(venues)
+    form.artist.choices = get_choices(Artist)
+    form.venue.choices = get_choices(Venue)
 
     return render_template("forms/new_show.html", form=form)
 
@@ -858,11 +1210,8 @@ def create_show_form():
 def create_show_submission():
     form = ShowForm()
 
-    artists = Artist.query.order_by("name").all()
-    form.artist.choices = build_choices_from_query(artists)
-
-    venues = Venue.query.order_by("name").all()
-    form.venue.choices = build_choices_from_query(venues)
+    form.artist.choices = get_choices(Artist, max_age=0)
+    form.venue.choices = get_choices(Venue, max_age=0)
 
     if not form.validate_on_submit():
         flash_form_errors(form, "Failed to create a show.")
@@ -894,9 +1243,12 @@ def create_show_submission():
 # ----------------------------------------------------------------------------#
 
 
+SHOW_SORT = (Show.start_time, Show.artist_id, Show.venue_id)
+
+
 @app.route("/shows")
 def shows():
-    shows = (
+    upcoming_shows = (
         db.session.query(
             Show.venue_id,
             Venue.name.label("venue_name"),
@@ -907,8 +1259,12 @@ def shows():
         )
         .join(Venue)
         .join(Artist)
-        .filter(Show.start_time > datetime.today())
-        .all()
+        .filter(Show.start_time > get_current_time())
+    )
+
+    cursor = decode_cursor(request.args.get("cursor"), SHOW_SORT)
+    shows, next_cursor = paginate_by_keyset(
+        upcoming_shows, SHOW_SORT, cursor, get_page_size()
     )
     data = []
     for show in shows:
@@ -919,10 +1275,60 @@ def shows():
                 "artist_id": show.artist_id,
                 "artist_name": show.artist_name,
                 "artist_image_link": show.image_link,
-                "start_time": show.start_time.strftime("%m/%d/%y, %H:%M"),
+                "start_time": show.start_time,
             }
         )
-    return render_template("pages/shows.html", shows=data)
+    return render_template("pages/shows.html", shows=data, next_cursor=next_cursor)
+
+
+# ----------------------------------------------------------------------------#
+#  Bulk Import
+# ----------------------------------------------------------------------------#
+
+
+IMPORT_MODELS = {"venues": Venue, "artists": Artist, "genres": Genre, "shows": Show}
+
+
+@app.cli.command("import")
+@click.argument("kind", type=click.Choice(IMPORT_KINDS))
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+@click.option(
+    "--format",
+    "file_format",
+    type=click.Choice(FILE_FORMATS),
+    help="File format. Guessed from the file extension by default.",
+)
+@click.option(
+    "--batch-size",
+    default=1000,
+    show_default=True,
+    type=click.IntRange(min=1),
+    help="Rows inserted and committed together.",
+)
+def import_data(kind, path, file_format, batch_size):
+    """
+    Bulk import venues, artists, genres or shows from a CSV or JSON-lines file.
+
+    Rows are validated like the matching create form. Genres are given by name.
+    """
+    file_format = file_format or guess_format(path)
+    if file_format is None:
+        raise click.UsageError("Cannot tell the file format, pass --format.")
+
+    def report(line_number, messages):
+        for message in messages:
+            click.echo(f"{path}:{line_number}: {message}", err=True)
+
+    importer = BulkImporter(db, kind, batch_size, report)
+    try:
+        importer.run(read_rows(path, file_format))
+    finally:
+        # Core inserts bypass the session events that keep these caches current.
+        model = IMPORT_MODELS[kind]
+        invalidate_choices(model)
+        if model in name_indexes:
+            name_indexes[model].clear()
+    click.echo(importer.summary())
 
 
 # ----------------------------------------------------------------------------#
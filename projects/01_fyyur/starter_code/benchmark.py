@@ -0,0 +1,346 @@
+"""
+Benchmarks for Fyyur's data access paths.
+
+Each benchmark seeds a scratch database, then reports the number of queries
+and the latency of the current implementation next to the one it replaced.
+
+Usage:
+    python benchmark.py venues --venues 2000 --areas 50
+    python benchmark.py search --rows 100000
+    python benchmark.py datetime --rows 10000
+
+The scratch database is a SQLite file in the temp directory. Set
+BENCHMARK_DATABASE_URL to run against another database instead.
+!!NOTE every table in that database is dropped and recreated.
+"""
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import babel.dates
+import dateutil.parser
+
+# The app reads its database URL on import, so point it at the scratch database first.
+os.environ["DATABASE_URL"] = os.environ.get(
+    "BENCHMARK_DATABASE_URL",
+    "sqlite:///" + os.path.join(tempfile.gettempdir(), "fyyur_benchmark.db"),
+)
+
+from sqlalchemy import event
+
+from app import (
+    app,
+    db,
+    Artist,
+    Show,
+    Venue,
+    format_datetime,
+    get_name_index,
+    get_venue_listing,
+    search_by_name,
+)
+from formatting import format_cached
+
+# ----------------------------------------------------------------------------#
+# Measurement
+# ----------------------------------------------------------------------------#
+
+
+class QueryCounter:
+    """Counts the statements sent to the database while active."""
+
+    def __init__(self):
+        self.count = 0
+
+    def __enter__(self):
+        event.listen(db.engine, "before_cursor_execute", self._on_execute)
+        return self
+
+    def __exit__(self, *exc_info):
+        event.remove(db.engine, "before_cursor_execute", self._on_execute)
+
+    def _on_execute(self, *args):
+        self.count += 1
+
+
+def measure(label, fn, repeat):
+    """
+    Runs fn repeat times with a fresh session and prints queries and latency.
+
+    Returns the result of the last run so implementations can be compared.
+    """
+    timings = []
+    for _ in range(repeat):
+        db.session.remove()
+        with QueryCounter() as counter:
+            start = time.perf_counter()
+            result = fn()
+            timings.append((time.perf_counter() - start) * 1000)
+
+    print(
+        f"{label:<12} queries={counter.count:<6} "
+        f"median={statistics.median(timings):9.2f}ms best={min(timings):9.2f}ms"
+    )
+    return result
+
+
+# ----------------------------------------------------------------------------#
+# Seed Data
+# ----------------------------------------------------------------------------#
+
+
+def reset_database():
+    db.drop_all()
+    db.create_all()
+
+
+def seed_venues_and_shows(num_venues, num_areas, num_artists, shows_per_venue):
+    """Inserts venues spread over areas, each with a mix of past and upcoming shows."""
+    rng = random.Random(0)
+    db.session.execute(
+        Artist.__table__.insert(),
+        [
+            {
+                "id": artist_id,
+                "name": f"Artist {artist_id}",
+                "city": "Oakland",
+                "state": "CA",
+                "phone": "555-555-5555",
+            }
+            for artist_id in range(1, num_artists + 1)
+        ],
+    )
+    db.session.execute(
+        Venue.__table__.insert(),
+        [
+            {
+                "id": venue_id,
+                "name": f"Venue {venue_id}",
+                "city": f"City {venue_id % num_areas}",
+                "state": "CA",
+                "address": f"{venue_id} Main Street",
+                "phone": "555-555-5555",
+            }
+            for venue_id in range(1, num_venues + 1)
+        ],
+    )
+
+    now = datetime.today()
+    shows = []
+    for venue_id in range(1, num_venues + 1):
+        for day in range(shows_per_venue):
+            offset = timedelta(days=day - shows_per_venue // 2, hours=1)
+            shows.append(
+                {
+                    "artist_id": rng.randint(1, num_artists),
+                    "venue_id": venue_id,
+                    "start_time": now + offset,
+                }
+            )
+    db.session.execute(Show.__table__.insert(), shows)
+    db.session.commit()
+
+
+# ----------------------------------------------------------------------------#
+# Venue Listing
+# ----------------------------------------------------------------------------#
+
+
+def legacy_venue_listing():
+    """The /venues implementation before get_venue_listing: one query per area and venue."""
+    areas = (
+        db.session.query(Venue.city, Venue.state)
+        .group_by(Venue.city)
+        .group_by(Venue.state)
+        .order_by(Venue.city)
+        .all()
+    )
+    data = []
+    for area in areas:
+        venues = (
+            db.session.query(Venue.id, Venue.name)
+            .filter(Venue.city == area.city)
+            .filter(Venue.state == area.state)
+            .all()
+        )
+        venue_data = []
+        for venue in venues:
+            num_upcoming_shows = (
+                db.session.query(Show.venue_id)
+                .filter(Show.venue_id == venue.id)
+                .filter(Show.start_time > datetime.today())
+                .count()
+            )
+            venue_data.append(
+                {
+                    "id": venue.id,
+                    "name": venue.name,
+                    "num_upcoming_shows": num_upcoming_shows,
+                }
+            )
+        data.append({"city": area.city, "state": area.state, "venues": venue_data})
+    return data
+
+
+def flatten_listing(areas):
+    return sorted(
+        (area["city"], area["state"], venue["id"], venue["num_upcoming_shows"])
+        for area in areas
+        for venue in area["venues"]
+    )
+
+
+def bench_venues(args):
+    reset_database()
+    seed_venues_and_shows(args.venues, args.areas, args.artists, args.shows)
+    print(
+        f"/venues: {args.venues} venues in {args.areas} areas, "
+        f"{args.shows} shows per venue"
+    )
+
+    legacy = measure("legacy", legacy_venue_listing, args.repeat)
+    current = measure("grouped", get_venue_listing, args.repeat)
+    if flatten_listing(legacy) != flatten_listing(current):
+        raise SystemExit("Venue listings differ between implementations.")
+
+
+# ----------------------------------------------------------------------------#
+# Name Search
+# ----------------------------------------------------------------------------#
+
+NAME_WORDS = (
+    "Blue Note Velvet Underground Rock Hall Jazz Club Electric Ballroom Crystal "
+    "Palace Golden Gate Silver Lounge Midnight Garden Echo Chamber Neon Tavern"
+).split()
+SEARCH_TERMS = ["a", "rock", "blue note", "allroo", "zzz"]
+
+
+def seed_artist_names(num_rows):
+    """Inserts artists with names made up of a few random words and a number."""
+    rng = random.Random(0)
+    rows = []
+    for artist_id in range(1, num_rows + 1):
+        words = rng.sample(NAME_WORDS, rng.randint(1, 3))
+        rows.append(
+            {
+                "id": artist_id,
+                "name": f"{' '.join(words)} {artist_id}",
+                "city": "Oakland",
+                "state": "CA",
+                "phone": "555-555-5555",
+            }
+        )
+    db.session.execute(Artist.__table__.insert(), rows)
+    db.session.commit()
+
+
+def legacy_search(search_term, page_size):
+    """Name search before search_by_name: an unindexable ILIKE plus a COUNT."""
+    matches = db.session.query(Artist.id, Artist.name).filter(
+        Artist.name.ilike(f"%{search_term}%")
+    )
+    return (
+        matches.order_by(Artist.name, Artist.id).limit(page_size).all(),
+        matches.count(),
+    )
+
+
+def bench_search(args):
+    reset_database()
+    seed_artist_names(args.rows)
+    print(f"/artists/search: {args.rows} artists, first page of {args.page_size}")
+
+    index = get_name_index(Artist)
+    index.clear()
+    measure("index load", lambda: get_name_index(Artist), 1)
+
+    for term in SEARCH_TERMS:
+        print(f'"{term}"')
+        legacy = measure(
+            "legacy", lambda: legacy_search(term, args.page_size), args.repeat
+        )
+        current = measure(
+            "trigram",
+            lambda: search_by_name(Artist, term, None, args.page_size),
+            args.repeat,
+        )
+        if legacy[1] != current[2]:
+            raise SystemExit(f'Match counts differ for "{term}".')
+
+
+# ----------------------------------------------------------------------------#
+# Datetime Filter
+# ----------------------------------------------------------------------------#
+
+
+def legacy_format_datetime(value, format="medium"):
+    """The datetime filter before formatting.py: parses string and pattern per call."""
+    date = dateutil.parser.parse(value)
+    if format == "full":
+        format = "EEEE MMMM, d, y 'at' h:mma"
+    elif format == "medium":
+        format = "EE MM, dd, y h:mma"
+    return babel.dates.format_datetime(date, format)
+
+
+def bench_datetime(args):
+    rng = random.Random(0)
+    now = datetime.today().replace(second=0, microsecond=0)
+    start_times = [
+        now + timedelta(minutes=rng.randint(0, 60 * 24 * 365)) for _ in range(args.rows)
+    ]
+    # The controllers used to hand templates strftime strings to parse again.
+    legacy_values = [value.strftime("%m/%d/%y, %H:%M") for value in start_times]
+    print(f"datetime filter: {args.rows} show start times, 'full' format")
+
+    def format_cold():
+        format_cached.cache_clear()
+        return [format_datetime(value, "full") for value in start_times]
+
+    legacy = measure(
+        "legacy",
+        lambda: [legacy_format_datetime(value, "full") for value in legacy_values],
+        args.repeat,
+    )
+    cold = measure("compiled", format_cold, args.repeat)
+    # Formatting values again is served from the memoized results, as long as
+    # they fit in the cache.
+    cached = start_times[-format_cached.cache_info().maxsize :]
+    measure("memoized", lambda: [format_datetime(value, "full") for value in cached], 1)
+    if legacy != cold:
+        raise SystemExit("Formatted dates differ between implementations.")
+
+
+# ----------------------------------------------------------------------------#
+# Launch
+# ----------------------------------------------------------------------------#
+
+BENCHMARKS = {
+    "datetime": bench_datetime,
+    "search": bench_search,
+    "venues": bench_venues,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("benchmark", choices=sorted(BENCHMARKS))
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--venues", type=int, default=2000)
+    parser.add_argument("--areas", type=int, default=50)
+    parser.add_argument("--artists", type=int, default=500)
+    parser.add_argument("--shows", type=int, default=4, help="shows per venue")
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--page-size", type=int, default=20)
+    args = parser.parse_args()
+
+    with app.app_context():
+        BENCHMARKS[args.benchmark](args)
+
+
+if __name__ == "__main__":
+    main()
@@ -7,8 +7,25 @@ basedir = os.path.abspath(os.path.dirname(__file__))
 # Enable debug mode.
 DEBUG = True
 
+# Number of rows per page on paginated listing and search pages.
+# Clients can ask for a different page size with ?page_size=, up to MAX_PAGE_SIZE.
+PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+# Number of most recent past shows listed on venue and artist pages.
+PAST_SHOWS_LIMIT = 10
+
+# Seconds form dropdown choices are cached for. Changes committed by this
+# process show up at once; changes made by other workers or the import command
+# show up within this many seconds. Submissions always validate against the
+# database.
+CHOICES_MAX_AGE = 60
+
 # Connect to the database
 
 
 # TODO IMPLEMENT DATABASE URL
-SQLALCHEMY_DATABASE_URI = "postgresql://cristinasatterfield@localhost:5432/fyyur02"
+# DATABASE_URL overrides the local database, e.g. for benchmarks and tests.
+SQLALCHEMY_DATABASE_URI = os.environ.get(
+    "DATABASE_URL", "postgresql://cristinasatterfield@localhost:5432/fyyur02"
+)
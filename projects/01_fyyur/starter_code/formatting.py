@@ -0,0 +1,61 @@
+"""
+Cached date formatting for the `datetime` template filter.
+
+Listing and detail pages format a start time for every show row. Instead of
+parsing a date string, a Babel pattern and a locale on every call, the filter
+takes datetime objects as they come from the database, compiles each pattern
+once per locale and memoizes recently formatted values.
+"""
+from datetime import datetime
+from functools import lru_cache
+
+import babel.dates
+import dateutil.parser
+from babel import Locale
+
+# Custom patterns for the format names templates use.
+DATETIME_FORMATS = {
+    "full": "EEEE MMMM, d, y 'at' h:mma",
+    "medium": "EE MM, dd, y h:mma",
+}
+
+# Format names Babel resolves from the locale rather than parsing as a pattern.
+BABEL_FORMATS = ("full", "long", "medium", "short")
+
+
+@lru_cache(maxsize=None)
+def get_pattern(format, locale):
+    """Returns the compiled pattern and the parsed locale for a format and locale."""
+    pattern = DATETIME_FORMATS.get(format, format)
+    return babel.dates.parse_pattern(pattern), Locale.parse(locale)
+
+
+def format_datetime(value, format="medium", locale=None):
+    """
+    Formats a datetime, or a date string, with a format name or a Babel pattern.
+
+    Results are memoized, so a page rendered again formats each time once.
+    """
+    zone = None
+    if isinstance(value, datetime):
+        # Aware datetimes for the same instant compare and hash equal whatever
+        # their timezone, so the zone has to be part of the cache key.
+        zone = (value.utcoffset(), value.tzname())
+    return format_cached(value, zone, format, locale)
+
+
+@lru_cache(maxsize=4096)
+def format_cached(value, zone, format, locale):
+    """Formats value for format_datetime; zone only keys the cache."""
+    if isinstance(value, str):
+        value = dateutil.parser.parse(value)
+    locale = locale or babel.dates.LC_TIME
+
+    if format in BABEL_FORMATS and format not in DATETIME_FORMATS:
+        return babel.dates.format_datetime(value, format, locale=locale)
+
+    pattern, locale = get_pattern(format, locale)
+    # Babel reads naive datetimes as UTC, without converting the time shown.
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=babel.dates.UTC)
+    return pattern.apply(value, locale)
@@ -32,7 +32,6 @@ class FutureDate(object):
         self.message = message
 
     def __call__(self, form, field):
-        print("Field data - Future Date", field.data)
         if field.data and field.data < datetime.today():
             raise ValidationError(self.message)
 
@@ -0,0 +1,360 @@
+"""
+Streaming bulk import of venues, artists, genres and shows.
+
+Rows are read lazily from CSV or JSON-lines files, validated with the same
+forms the create pages use and inserted with one executemany per batch, so
+memory use depends on the batch size rather than on the size of the file.
+Rows that fail validation or are rejected by the database are reported and
+skipped; the rest of the file is still imported.
+"""
+import csv
+import json
+import os
+from collections import namedtuple
+from itertools import islice
+
+from sqlalchemy import func, select, text
+from sqlalchemy.exc import DBAPIError
+from werkzeug.datastructures import MultiDict
+
+from forms import ArtistForm, ShowForm, VenueForm
+
+IMPORT_KINDS = ("venues", "artists", "genres", "shows")
+FILE_FORMATS = ("csv", "jsonl")
+
+# Several genres in one CSV cell are separated by commas, e.g. "Jazz, Blues".
+GENRE_SEPARATOR = ","
+
+ImportRecord = namedtuple("ImportRecord", ["line_number", "values", "genre_ids"])
+
+
+class RowError(Exception):
+    """A row that cannot be imported, with the messages explaining why."""
+
+    def __init__(self, messages):
+        super().__init__(messages)
+        self.messages = messages
+
+
+# ----------------------------------------------------------------------------#
+# Reading Files
+# ----------------------------------------------------------------------------#
+
+
+def guess_format(path):
+    """Returns the file format matching the extension of path, or None."""
+    extension = os.path.splitext(path)[1].lstrip(".").lower()
+    if extension in ("json", "jsonl", "ndjson"):
+        return "jsonl"
+    if extension == "csv":
+        return "csv"
+    return None
+
+
+def read_rows(path, file_format):
+    """
+    Yields (line number, row) pairs from a CSV or JSON-lines file, one at a time.
+
+    CSV files need a header row naming the form fields. Lines that are not
+    valid JSON objects are yielded as RowError instead of a row.
+    """
+    with open(path, newline="", encoding="utf-8") as rows_file:
+        if file_format == "csv":
+            reader = csv.DictReader(rows_file)
+            for row in reader:
+                yield reader.line_num, row
+            return
+
+        for line_number, line in enumerate(rows_file, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as error:
+                yield line_number, RowError([f"Invalid JSON: {error}"])
+                continue
+            if not isinstance(row, dict):
+                row = RowError(["Each line must be a JSON object."])
+            yield line_number, row
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def validate_form(form_class, row, **choices):
+    """
+    Validates a row with a form, as if it had been submitted from the page.
+
+    Lists become repeated form values. Choices for fields whose options come
+    from the database are passed as keyword arguments.
+    Returns the form data, or raises RowError with the validation messages.
+    """
+    formdata = MultiDict()
+    for key, value in row.items():
+        for item in value if isinstance(value, list) else [value]:
+            if item is not None:
+                formdata.add(key, str(item))
+
+    form = form_class(formdata=formdata, meta={"csrf": False})
+    for field_name, field_choices in choices.items():
+        form[field_name].choices = field_choices
+    if not form.validate():
+        raise RowError(
+            [message for messages in form.errors.values() for message in messages]
+        )
+    return form.data
+
+
+def to_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+# ----------------------------------------------------------------------------#
+# Importer
+# ----------------------------------------------------------------------------#
+
+
+class BulkImporter:
+    """
+    Validates and inserts rows of one kind in batches.
+
+    Each batch is written with one executemany per table and committed on its
+    own. If the database rejects a batch, its rows are retried one at a time
+    so only the offending rows are skipped.
+    """
+
+    def __init__(self, db, kind, batch_size=1000, report=None):
+        self.session = db.session
+        self.dialect = db.engine.dialect.name
+        self.kind = kind
+        self.table = db.metadata.tables[kind]
+        self.tables = db.metadata.tables
+        self.batch_size = batch_size
+        self.report = report or (lambda line_number, messages: None)
+
+        self.imported = 0
+        self.skipped = 0
+        self.failed = 0
+        # Lowercased genre name -> id, loaded once when the import starts.
+        self.genre_ids = {}
+        # Genre names added by the current batch, to skip repeated names.
+        self._batch_genres = set()
+        # Artist and venue ids the current batch of shows refers to that exist.
+        self._known_ids = {}
+
+    def run(self, rows):
+        genres = self.tables["genres"]
+        self.genre_ids = {
+            name.lower(): genre_id
+            for genre_id, name in self.session.execute(
+                select([genres.c.id, genres.c.name])
+            )
+        }
+
+        for batch in chunked(rows, self.batch_size):
+            self._insert(self._prepare(batch))
+
+    def summary(self):
+        return (
+            f"Imported {self.imported} {self.kind}, skipped {self.skipped} "
+            f"existing, {self.failed} failed."
+        )
+
+    def _fail(self, line_number, messages):
+        self.failed += 1
+        self.report(line_number, messages)
+
+    def _prepare(self, batch):
+        """Turns the valid rows of a batch into records ready to insert."""
+        if self.kind == "shows":
+            self._load_show_references(batch)
+
+        records = []
+        self._batch_genres = set()
+        for line_number, row in batch:
+            try:
+                if isinstance(row, RowError):
+                    raise row
+                record = getattr(self, f"_prepare_{self.kind}")(line_number, row)
+            except RowError as error:
+                self._fail(line_number, error.messages)
+                continue
+            if record is None:
+                self.skipped += 1
+            else:
+                records.append(record)
+        return records
+
+    def _resolve_genres(self, row):
+        """Replaces the genre names of a row with the ids of the genres."""
+        names = row.get("genres") or []
+        if isinstance(names, str):
+            names = names.split(GENRE_SEPARATOR)
+        names = [str(name).strip() for name in names if name is not None]
+        names = [name for name in names if name]
+
+        unknown = [name for name in names if name.lower() not in self.genre_ids]
+        if unknown:
+            raise RowError([f"Unknown genre: {name}" for name in unknown])
+
+        genre_ids = sorted({self.genre_ids[name.lower()] for name in names})
+        return dict(row, genres=genre_ids), [(genre_id, "") for genre_id in genre_ids]
+
+    def _listing_values(self, data):
+        # Like build_venue_from_form/build_artist_from_form, fall back to the
+        # column default if no image link is given.
+        image_link = data["image_link"] or self.table.c.image_link.server_default.arg
+        return {
+            "name": data["name"],
+            "city": data["city"],
+            "state": data["state"],
+            "phone": data["phone"],
+            "website_link": data["website_link"],
+            "facebook_link": data["facebook_link"],
+            "seeking_description": data["seeking_description"],
+            "image_link": image_link,
+        }
+
+    def _prepare_venues(self, line_number, row):
+        row, genre_choices = self._resolve_genres(row)
+        data = validate_form(VenueForm, row, genres=genre_choices)
+        values = self._listing_values(data)
+        values["address"] = data["address"]
+        values["seeking_talent"] = data["seeking_talent"] == "True"
+        return ImportRecord(line_number, values, data["genres"])
+
+    def _prepare_artists(self, line_number, row):
+        row, genre_choices = self._resolve_genres(row)
+        data = validate_form(ArtistForm, row, genres=genre_choices)
+        values = self._listing_values(data)
+        values["seeking_venue"] = data["seeking_venue"] == "True"
+        return ImportRecord(line_number, values, data["genres"])
+
+    def _prepare_genres(self, line_number, row):
+        name = (row.get("name") or "").strip()
+        if not name:
+            raise RowError(["Please input a genre name."])
+        max_length = self.table.c.name.type.length
+        if len(name) > max_length:
+            raise RowError(
+                [f"Genre name must be less than {max_length} characters long."]
+            )
+
+        if name.lower() in self.genre_ids or name.lower() in self._batch_genres:
+            return None
+        self._batch_genres.add(name.lower())
+        return ImportRecord(line_number, {"name": name}, ())
+
+    def _load_show_references(self, batch):
+        """Loads which of the artists and venues a batch of shows refers to exist."""
+        self._known_ids = {}
+        for field_name, table_name in (("artist", "artists"), ("venue", "venues")):
+            ids = {
+                to_int(row.get(field_name))
+                for _, row in batch
+                if not isinstance(row, RowError)
+            }
+            ids.discard(None)
+            table = self.tables[table_name]
+            self._known_ids[field_name] = set()
+            if ids:
+                self._known_ids[field_name] = {
+                    row_id
+                    for row_id, in self.session.execute(
+                        select([table.c.id]).where(table.c.id.in_(ids))
+                    )
+                }
+
+    def _prepare_shows(self, line_number, row):
+        # The form only accepts artists and venues that exist, so offer the
+        # referenced ids as the only choices if they do.
+        choices = {}
+        for field_name, known_ids in self._known_ids.items():
+            row_id = to_int(row.get(field_name))
+            choices[field_name] = [(row_id, "")] if row_id in known_ids else []
+
+        data = validate_form(ShowForm, row, **choices)
+        values = {
+            "artist_id": data["artist"],
+            "venue_id": data["venue"],
+            "start_time": data["start_time"],
+        }
+        return ImportRecord(line_number, values, ())
+
+    def _insert(self, records):
+        if not records:
+            return
+
+        try:
+            self._write(records)
+            self.session.commit()
+        except DBAPIError:
+            self.session.rollback()
+        else:
+            self._imported(records)
+            return
+
+        for record in records:
+            try:
+                self._write([record])
+                self.session.commit()
+            except DBAPIError as error:
+                self.session.rollback()
+                self._fail(record.line_number, [str(error.orig).strip()])
+            else:
+                self._imported([record])
+
+    def _imported(self, records):
+        self.imported += len(records)
+        if self.kind == "genres":
+            for record in records:
+                self.genre_ids[record.values["name"].lower()] = record.values["id"]
+
+    def _write(self, records):
+        if "id" in self.table.c:
+            row_ids = self._reserve_ids(len(records))
+            for record, row_id in zip(records, row_ids):
+                record.values["id"] = row_id
+        self.session.execute(self.table.insert(), [record.values for record in records])
+
+        if self.kind in ("venues", "artists"):
+            links = self.tables[f"{self.kind}_genres"]
+            owner_key = f"{self.kind[:-1]}_id"
+            rows = [
+                {owner_key: record.values["id"], "genre_id": genre_id}
+                for record in records
+                for genre_id in record.genre_ids
+            ]
+            if rows:
+                self.session.execute(links.insert(), rows)
+
+    def _reserve_ids(self, count):
+        """
+        Reserves ids for count new rows.
+
+        executemany cannot return generated keys, but the genre associations
+        need the ids of new venues and artists, so ids are assigned up front.
+        """
+        if self.dialect == "postgresql":
+            result = self.session.execute(
+                text(
+                    "SELECT nextval(pg_get_serial_sequence(:table, 'id')) "
+                    "FROM generate_series(1, :count)"
+                ),
+                {"table": self.table.name, "count": count},
+            )
+            return [row_id for row_id, in result]
+
+        # Without sequences, continue after the highest id in the table.
+        highest = self.session.execute(select([func.max(self.table.c.id)])).scalar()
+        start = (highest or 0) + 1
+        return range(start, start + count)
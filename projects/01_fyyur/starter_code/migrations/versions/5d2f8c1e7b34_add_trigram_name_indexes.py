@@ -0,0 +1,41 @@
+"""Add trigram indexes for venue and artist name search.
+
+Revision ID: 5d2f8c1e7b34
+Revises: acb89e42b844
+Create Date: 2026-10-18 10:12:41.503318
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "5d2f8c1e7b34"
+down_revision = "acb89e42b844"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # GIN trigram indexes let Postgres answer name ILIKE '%term%' searches
+    # and rank them by similarity() without scanning the whole table.
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    op.create_index(
+        "ix_venues_name_trgm",
+        "venues",
+        ["name"],
+        postgresql_using="gin",
+        postgresql_ops={"name": "gin_trgm_ops"},
+    )
+    op.create_index(
+        "ix_artists_name_trgm",
+        "artists",
+        ["name"],
+        postgresql_using="gin",
+        postgresql_ops={"name": "gin_trgm_ops"},
+    )
+
+
+def downgrade():
+    op.drop_index("ix_artists_name_trgm", table_name="artists")
+    op.drop_index("ix_venues_name_trgm", table_name="venues")
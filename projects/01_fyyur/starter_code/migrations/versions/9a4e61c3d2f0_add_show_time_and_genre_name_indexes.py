@@ -0,0 +1,34 @@
+"""Add show time and genre name indexes.
+
+Revision ID: 9a4e61c3d2f0
+Revises: 5d2f8c1e7b34
+Create Date: 2026-10-18 11:04:17.218664
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "9a4e61c3d2f0"
+down_revision = "5d2f8c1e7b34"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # The (artist_id, venue_id, start_time) primary key only serves lookups
+    # by artist. Venue pages filter on venue_id plus a start_time range, and
+    # /shows scans upcoming shows across every venue.
+    op.create_index(
+        "ix_shows_venue_id_start_time", "shows", ["venue_id", "start_time"]
+    )
+    op.create_index("ix_shows_start_time", "shows", ["start_time"])
+    # Genre choices are always loaded ordered by name.
+    op.create_index("ix_genres_name", "genres", ["name"])
+
+
+def downgrade():
+    op.drop_index("ix_genres_name", table_name="genres")
+    op.drop_index("ix_shows_start_time", table_name="shows")
+    op.drop_index("ix_shows_venue_id_start_time", table_name="shows")
@@ -0,0 +1,155 @@
+"""
+In-process trigram index for venue and artist name search.
+
+On Postgres, name searches are answered by pg_trgm GIN indexes. Databases
+without pg_trgm, like the SQLite databases used for tests and benchmarks,
+fall back to this index. It extracts trigrams and scores similarity the same
+way pg_trgm does, so both paths rank results alike.
+"""
+import heapq
+import re
+import threading
+from collections import defaultdict, namedtuple
+
+# pg_trgm only looks at alphanumeric words; everything else separates words.
+WORD_PATTERN = re.compile(r"[^\W_]+")
+
+SearchMatch = namedtuple("SearchMatch", ["distance", "name", "id"])
+
+
+def trigrams(text):
+    """
+    Returns the set of trigrams pg_trgm extracts from text.
+
+    Each lowercased word is padded with two spaces in front and one behind,
+    so short words and word boundaries produce trigrams too.
+    """
+    grams = set()
+    for word in WORD_PATTERN.findall(text.lower()):
+        padded = f"  {word} "
+        for i in range(len(padded) - 2):
+            grams.add(padded[i : i + 3])
+    return grams
+
+
+def inner_trigrams(text):
+    """
+    Returns the unpadded trigrams of each word in text.
+
+    Any name that contains text as a substring contains all of these, which
+    makes them safe to narrow down candidates for a substring search.
+    """
+    grams = set()
+    for word in WORD_PATTERN.findall(text.lower()):
+        for i in range(len(word) - 2):
+            grams.add(word[i : i + 3])
+    return grams
+
+
+def similarity(grams, other_grams):
+    """Share of trigrams two strings have in common, like pg_trgm's similarity()."""
+    if not grams or not other_grams:
+        return 0.0
+    shared = len(grams & other_grams)
+    return shared / (len(grams) + len(other_grams) - shared)
+
+
+def distance(similarity_score):
+    """Turns a similarity into the integer sort key used to rank search results."""
+    return round((1 - similarity_score) * 1000)
+
+
+class TrigramIndex:
+    """
+    Maps trigrams to the ids of the names that contain them.
+
+    The index is loaded lazily from the database and kept up to date with
+    add() and remove() as names change.
+    """
+
+    def __init__(self):
+        self.loaded = False
+        self._lock = threading.Lock()
+        self._names = {}
+        self._postings = defaultdict(set)
+
+    def load(self, rows):
+        """Replaces the contents of the index with rows of (id, name)."""
+        with self._lock:
+            self._names = {}
+            self._postings = defaultdict(set)
+            for row_id, name in rows:
+                self._add(row_id, name)
+            self.loaded = True
+
+    def clear(self):
+        """Empties the index so it is reloaded before the next search."""
+        with self._lock:
+            self._names = {}
+            self._postings = defaultdict(set)
+            self.loaded = False
+
+    def add(self, row_id, name):
+        with self._lock:
+            self._remove(row_id)
+            self._add(row_id, name)
+
+    def remove(self, row_id):
+        with self._lock:
+            self._remove(row_id)
+
+    def search(self, term, after=None, limit=None):
+        """
+        Finds the names containing term, best match first.
+
+        Matches are ordered by (distance, name, id), the same key the Postgres
+        search path sorts and paginates by. Only matches sorting after the
+        `after` key are returned, at most `limit` of them.
+
+        Returns the list of SearchMatch rows and the total number of matches.
+        """
+        needle = term.lower()
+        term_grams = trigrams(term)
+
+        with self._lock:
+            candidate_ids = self._candidates(inner_trigrams(term))
+            matches = []
+            for row_id in candidate_ids:
+                name, lowered, grams = self._names[row_id]
+                if needle in lowered:
+                    score = similarity(term_grams, grams)
+                    matches.append(SearchMatch(distance(score), name, row_id))
+
+        total = len(matches)
+        if after is not None:
+            after = tuple(after)
+            matches = [match for match in matches if match > after]
+        if limit is None:
+            return sorted(matches), total
+        return heapq.nsmallest(limit, matches), total
+
+    def _candidates(self, grams):
+        if not grams:
+            return list(self._names)
+
+        postings = sorted((self._postings.get(gram, set()) for gram in grams), key=len)
+        return set.intersection(*postings)
+
+    def _add(self, row_id, name):
+        grams = trigrams(name)
+        self._names[row_id] = (name, name.lower(), grams)
+        # Padded trigrams include every inner trigram, so they cover both lookups.
+        for gram in grams:
+            self._postings[gram].add(row_id)
+
+    def _remove(self, row_id):
+        entry = self._names.pop(row_id, None)
+        if entry is None:
+            return
+
+        _, _, grams = entry
+        for gram in grams:
+            ids = self._postings[gram]
+            ids.discard(row_id)
+            if not ids:
+                del self._postings[gram]
@@ -0,0 +1,753 @@
+import base64
+import html
+import json
+import os
+import re
+import tempfile
+import time
+import unittest
+from datetime import datetime, timedelta, timezone
+from unittest import mock
+
+# The app reads its database URL on import, so point it at a test database first.
+os.environ["DATABASE_URL"] = "sqlite://"
+
+import babel.dates
+from sqlalchemy import event
+
+from app import (
+    app,
+    db,
+    ARTIST_SORT,
+    SHOW_SORT,
+    Artist,
+    Genre,
+    Show,
+    Venue,
+    decode_cursor,
+    encode_cursor,
+    escape_like,
+    format_datetime,
+    get_choices,
+    get_page_size,
+    get_name_index,
+    get_num_upcoming_shows_by_artists,
+    get_num_upcoming_shows_by_venues,
+    get_shows_at_venue,
+    get_shows_by_artist,
+    get_venue_listing,
+    partition_shows,
+    search_by_name,
+    set_model_genres,
+)
+from search import SearchMatch, TrigramIndex
+
+
+class FyyurTestCase(unittest.TestCase):
+    """This class represents the Fyyur test case"""
+
+    def setUp(self):
+        """Define test variables and create a fresh database."""
+        app.config["TESTING"] = True
+        self.client = app.test_client
+        self.app_context = app.app_context()
+        self.app_context.push()
+
+        db.drop_all()
+        db.create_all()
+
+        db.session.add_all(
+            [Genre(name="Jazz"), Genre(name="Blues"), Genre(name="Rock")]
+        )
+        self.venue = Venue(
+            name="The Musical Hop",
+            city="San Francisco",
+            state="CA",
+            address="1015 Folsom Street",
+            phone="123-123-1234",
+        )
+        self.artist = Artist(
+            name="Guns N Petals",
+            city="San Francisco",
+            state="CA",
+            phone="326-123-5000",
+        )
+        db.session.add_all([self.venue, self.artist])
+        db.session.commit()
+
+        now = datetime.now()
+        for days in (-2, -1, 1, 2):
+            db.session.add(
+                Show(
+                    artist_id=self.artist.id,
+                    venue_id=self.venue.id,
+                    start_time=now + timedelta(days=days),
+                )
+            )
+        db.session.commit()
+
+    def tearDown(self):
+        """Executed after each test"""
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def capture_statements(self, fn):
+        """Runs fn and returns the (statement, parameters) it sent to the database."""
+        statements = []
+
+        def capture(conn, cursor, statement, parameters, context, executemany):
+            statements.append((statement, parameters))
+
+        event.listen(db.engine, "before_cursor_execute", capture)
+        try:
+            fn()
+        finally:
+            event.remove(db.engine, "before_cursor_execute", capture)
+        return statements
+
+    def query_plans(self, fn, table):
+        """Returns the EXPLAIN QUERY PLAN output of each statement fn runs against table."""
+        plans = []
+        for statement, parameters in self.capture_statements(fn):
+            if not re.search(rf"\bFROM {table}\b", statement):
+                continue
+            rows = db.session.connection().execute(
+                "EXPLAIN QUERY PLAN " + statement, parameters
+            )
+            plans.append("\n".join(row[-1] for row in rows))
+        self.assertTrue(plans, f"no statement against {table}")
+        return plans
+
+    def assertSearchesWithIndex(self, plans, table, index):
+        for plan in plans:
+            self.assertRegex(
+                plan, rf"SEARCH (TABLE )?{table} USING (COVERING )?INDEX {index}"
+            )
+
+    """
+    Indexes
+    """
+
+    def test_upcoming_show_counts_use_venue_time_index(self):
+        """ Test if upcoming show counts by venue search the venue/time index """
+        plans = self.query_plans(
+            lambda: get_num_upcoming_shows_by_venues([self.venue.id]), "shows"
+        )
+        self.assertSearchesWithIndex(plans, "shows", "ix_shows_venue_id_start_time")
+
+    def test_venue_shows_use_venue_time_index(self):
+        """ Test if a venue's shows are found through the venue/time index """
+        plans = self.query_plans(
+            lambda: partition_shows(get_shows_at_venue(self.venue), 10), "shows"
+        )
+        self.assertSearchesWithIndex(plans, "shows", "ix_shows_venue_id_start_time")
+
+    def test_artist_shows_use_primary_key(self):
+        """ Test if an artist's shows are found through the primary key """
+        plans = self.query_plans(
+            lambda: partition_shows(get_shows_by_artist(self.artist), 10), "shows"
+        )
+        self.assertSearchesWithIndex(plans, "shows", r"sqlite_autoindex_shows_1")
+
+    def test_upcoming_shows_use_start_time_index(self):
+        """ Test if the /shows listing searches the start time index """
+        plans = self.query_plans(lambda: self.client().get("/shows"), "shows")
+        self.assertSearchesWithIndex(plans, "shows", "ix_shows_start_time")
+
+    def test_genres_are_ordered_by_name_index(self):
+        """ Test if genres are read in name order from the name index """
+        plans = self.query_plans(lambda: Genre.query.order_by("name").all(), "genres")
+        for plan in plans:
+            self.assertRegex(
+                plan, r"SCAN (TABLE )?genres USING (COVERING )?INDEX ix_genres_name"
+            )
+            self.assertNotIn("TEMP B-TREE", plan)
+
+    """
+    Past and Upcoming Shows
+    """
+
+    def test_shows_are_split_into_past_and_upcoming(self):
+        """ Test if shows are split around now, sorted and counted """
+        past, upcoming, past_count, upcoming_count = partition_shows(
+            get_shows_by_artist(self.artist)
+        )
+        now = datetime.now()
+        self.assertEqual((past_count, upcoming_count), (2, 2))
+        self.assertTrue(all(show.start_time <= now for show in past))
+        self.assertTrue(all(show.start_time > now for show in upcoming))
+        for shows in (past, upcoming):
+            self.assertEqual(len(shows), 2)
+            self.assertEqual(shows, sorted(shows, key=lambda show: show.start_time))
+
+    def test_past_limit_keeps_most_recent_past_shows(self):
+        """ Test if past_limit truncates past shows but not their count """
+        past, upcoming, past_count, upcoming_count = partition_shows(
+            get_shows_at_venue(self.venue), 1
+        )
+        latest_past = (
+            Show.query.filter(Show.start_time <= datetime.now())
+            .order_by(Show.start_time.desc())
+            .first()
+        )
+        self.assertEqual([show.start_time for show in past], [latest_past.start_time])
+        self.assertEqual(len(upcoming), 2)
+        self.assertEqual((past_count, upcoming_count), (2, 2))
+
+    def test_zero_past_limit_still_counts_past_shows(self):
+        """ Test if a past_limit of 0 lists no past shows but still counts them """
+        past, upcoming, past_count, upcoming_count = partition_shows(
+            get_shows_by_artist(self.artist), 0
+        )
+        self.assertEqual(past, [])
+        self.assertEqual(len(upcoming), 2)
+        self.assertEqual((past_count, upcoming_count), (2, 2))
+
+        limit = app.config["PAST_SHOWS_LIMIT"]
+        app.config["PAST_SHOWS_LIMIT"] = 0
+        try:
+            response = self.client().get(f"/artists/{self.artist.id}")
+        finally:
+            app.config["PAST_SHOWS_LIMIT"] = limit
+        self.assertRegex(response.data.decode(), r"2 Past\s+Shows")
+
+    def test_venue_listing_groups_venues_by_area(self):
+        """ Test if venues are grouped by city and state with upcoming show counts """
+        for name, city, state in [
+            ("The Dueling Pianos Bar", "New York", "NY"),
+            ("Empty Hall", "San Francisco", "CA"),
+            ("Lone Star Hall", "San Francisco", "TX"),
+        ]:
+            db.session.add(
+                Venue(
+                    name=name,
+                    city=city,
+                    state=state,
+                    address="1 Main St",
+                    phone="123-123-1234",
+                )
+            )
+        db.session.commit()
+
+        listing = [
+            (
+                area["city"],
+                area["state"],
+                [
+                    (venue["name"], venue["num_upcoming_shows"])
+                    for venue in area["venues"]
+                ],
+            )
+            for area in get_venue_listing()
+        ]
+        # The Musical Hop has two past and two upcoming shows.
+        self.assertEqual(
+            listing,
+            [
+                ("New York", "NY", [("The Dueling Pianos Bar", 0)]),
+                ("San Francisco", "CA", [("Empty Hall", 0), ("The Musical Hop", 2)]),
+                ("San Francisco", "TX", [("Lone Star Hall", 0)]),
+            ],
+        )
+
+    def test_upcoming_counts_agree_with_detail_pages(self):
+        """ Test if listing and detail pages count upcoming shows alike """
+        utc_now = datetime.now(timezone.utc).replace(tzinfo=None)
+        db.session.add(
+            Show(
+                artist_id=self.artist.id,
+                venue_id=self.venue.id,
+                start_time=utc_now - timedelta(hours=2),
+            )
+        )
+        db.session.commit()
+
+        # A local clock behind UTC would count the show two hours ago as upcoming.
+        tz = os.environ.get("TZ")
+        os.environ["TZ"] = "America/New_York"
+        time.tzset()
+        try:
+            _, _, _, upcoming_count = partition_shows(get_shows_at_venue(self.venue))
+            by_venue = get_num_upcoming_shows_by_venues([self.venue.id])
+            by_artist = get_num_upcoming_shows_by_artists([self.artist.id])
+            listing = get_venue_listing()
+        finally:
+            if tz is None:
+                del os.environ["TZ"]
+            else:
+                os.environ["TZ"] = tz
+            time.tzset()
+
+        self.assertEqual(upcoming_count, 2)
+        self.assertEqual(by_venue[self.venue.id], upcoming_count)
+        self.assertEqual(by_artist[self.artist.id], upcoming_count)
+        self.assertEqual(listing[0]["venues"][0]["num_upcoming_shows"], upcoming_count)
+
+    """
+    Search
+    """
+
+    def test_search_statement_count_does_not_grow_with_matches(self):
+        """ Test if a search runs a fixed number of statements however many match """
+        for i in range(5):
+            db.session.add(
+                Venue(
+                    name=f"Hop {i}",
+                    city="Austin",
+                    state="TX",
+                    address="1 Main St",
+                    phone="512-555-0100",
+                )
+            )
+            db.session.add(
+                Artist(name=f"Petals {i}", city="Austin", state="TX", phone="512")
+            )
+        db.session.commit()
+        get_name_index(Venue)
+        get_name_index(Artist)
+
+        for url, term, model in [
+            ("/venues/search", "hop", "venue"),
+            ("/artists/search", "petals", "artist"),
+        ]:
+            responses = []
+            statements = self.capture_statements(
+                lambda: responses.append(
+                    self.client().post(url, data={"search_term": term})
+                )
+            )
+            self.assertEqual(responses[0].status_code, 200)
+            self.assertEqual(
+                len(re.findall(rf'href="/{model}s/\d+"', responses[0].data.decode())),
+                6,
+            )
+            # The name index answers the search; one grouped query counts the
+            # upcoming shows of every match.
+            self.assertEqual(len(statements), 1, statements)
+            self.assertIn(f"shows.{model}_id", statements[0][0])
+
+    def test_wildcards_in_search_terms_match_literally(self):
+        """ Test if % and _ in a search term only match themselves """
+        for name in ["100% Jazz", "1000 Jazz", "Jazz_Club", "Jazz Club"]:
+            db.session.add(
+                Artist(name=name, city="Austin", state="TX", phone="512-555-0100")
+            )
+        db.session.commit()
+
+        for term, expected in [("0%", ["100% Jazz"]), ("z_c", ["Jazz_Club"])]:
+            pattern = f"%{escape_like(term)}%"
+            names = db.session.query(Artist.name).filter(
+                Artist.name.ilike(pattern, escape="\\")
+            )
+            self.assertEqual([name for name, in names], expected)
+            rows, _, count = search_by_name(Artist, term, None, 10)
+            self.assertEqual([row.name for row in rows], expected)
+            self.assertEqual(count, 1)
+
+    def test_renamed_venues_are_reindexed_on_commit(self):
+        """ Test if the name index follows committed renames and deletes only """
+        index = get_name_index(Venue)
+        self.venue.name = "The Jazz Cellar"
+        db.session.flush()
+        db.session.rollback()
+        self.assertEqual([m.id for m in index.search("hop")[0]], [self.venue.id])
+
+        self.venue.name = "The Jazz Cellar"
+        db.session.commit()
+        self.assertEqual(index.search("hop"), ([], 0))
+        self.assertEqual([m.id for m in index.search("jazz")[0]], [self.venue.id])
+
+        db.session.delete(self.venue)
+        db.session.commit()
+        self.assertEqual(index.search("jazz"), ([], 0))
+
+    """
+    Pagination
+    """
+
+    def add_artists(self, names):
+        artists = [
+            Artist(name=name, city="Austin", state="TX", phone="512-555-0100")
+            for name in names
+        ]
+        db.session.add_all(artists)
+        db.session.commit()
+        return artists
+
+    def walk_artist_pages(self, page_size):
+        """Follows the next page links of /artists; returns the ids on each page."""
+        pages = []
+        url = f"/artists?page_size={page_size}"
+        while url:
+            response = self.client().get(url)
+            self.assertEqual(response.status_code, 200)
+            page = response.data.decode()
+            pages.append([int(i) for i in re.findall(r'href="/artists/(\d+)"', page)])
+            next_link = re.search(r'href="([^"]*cursor=[^"]*)"', page)
+            url = html.unescape(next_link.group(1)) if next_link else None
+        return pages
+
+    def test_cursor_round_trips_sort_keys(self):
+        """ Test if decoding a page token gives back the encoded sort key """
+        show = Show.query.order_by(Show.start_time).first()
+        artist = Artist.query.first()
+
+        with app.test_request_context():
+            self.assertEqual(
+                decode_cursor(encode_cursor(show, SHOW_SORT), SHOW_SORT),
+                [show.start_time, show.artist_id, show.venue_id],
+            )
+            self.assertEqual(
+                decode_cursor(encode_cursor(artist, ARTIST_SORT), ARTIST_SORT),
+                [artist.name, artist.id],
+            )
+            self.assertIsNone(decode_cursor(None, ARTIST_SORT))
+
+    def test_tampered_cursors_are_rejected(self):
+        """ Test if malformed or mistyped page tokens return 400 """
+
+        def token(key):
+            return base64.urlsafe_b64encode(json.dumps(key).encode()).decode()
+
+        for cursor in [
+            token([1, 2]),
+            token(["Guns N Petals"]),
+            token(["Guns N Petals", "1"]),
+            token({"name": "Guns N Petals"}),
+            "not a token",
+        ]:
+            response = self.client().get("/artists", query_string={"cursor": cursor})
+            self.assertEqual(response.status_code, 400, cursor)
+
+        response = self.client().get(
+            "/shows", query_string={"cursor": token([1, 2, 3])}
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_artist_pages_have_no_duplicates_or_gaps(self):
+        """ Test if walking every artist page lists each artist exactly once """
+        self.add_artists(["Zed", "Amber", "Amber", "Miles", "Amber", "Nina", "Ella"])
+        expected = [artist.id for artist in Artist.query.order_by(*ARTIST_SORT)]
+
+        for page_size in (1, 2, 3, len(expected), len(expected) + 1):
+            pages = self.walk_artist_pages(page_size)
+            self.assertTrue(all(len(page) == page_size for page in pages[:-1]))
+            self.assertTrue(0 < len(pages[-1]) <= page_size)
+            self.assertEqual([i for page in pages for i in page], expected)
+
+    def test_search_pages_have_no_duplicates_or_gaps(self):
+        """ Test if walking every search page lists each match exactly once """
+        venues = [
+            Venue(
+                name=name,
+                city="Austin",
+                state="TX",
+                address="1 Main St",
+                phone="512-555-0100",
+            )
+            for name in ["Hop House", "Hop", "The Hop", "Hop House", "Hip Hop Club"]
+        ]
+        db.session.add_all(venues)
+        db.session.commit()
+
+        seen = []
+        form = {"search_term": "hop", "page_size": "2"}
+        while form:
+            response = self.client().post("/venues/search", data=form)
+            self.assertEqual(response.status_code, 200)
+            page = response.data.decode()
+            ids = [int(i) for i in re.findall(r'href="/venues/(\d+)"', page)]
+            self.assertTrue(0 < len(ids) <= 2)
+            seen.extend(ids)
+            cursor = re.search(r'name="cursor" value="([^"]*)"', page)
+            form = dict(form, cursor=html.unescape(cursor.group(1))) if cursor else None
+
+        self.assertEqual(sorted(seen), sorted([self.venue.id] + [v.id for v in venues]))
+        self.assertEqual(len(seen), len(set(seen)))
+
+    def test_page_size_is_clamped(self):
+        """ Test if page sizes are kept between 1 and MAX_PAGE_SIZE """
+        for requested, expected in [
+            ("", app.config["PAGE_SIZE"]),
+            ("0", 1),
+            ("-5", 1),
+            ("7", 7),
+            ("100000", app.config["MAX_PAGE_SIZE"]),
+            ("many", app.config["PAGE_SIZE"]),
+        ]:
+            query = {"page_size": requested} if requested else {}
+            with app.test_request_context(query_string=query):
+                self.assertEqual(get_page_size(), expected, requested)
+
+    """
+    Form Choices
+    """
+
+    def test_form_choices_are_served_from_cache(self):
+        """ Test if rendering a form again does not query for dropdown choices """
+        self.client().get("/shows/create")
+        statements = self.capture_statements(lambda: self.client().get("/shows/create"))
+
+        self.assertEqual(statements, [])
+
+    def test_form_choices_are_invalidated_on_commit(self):
+        """ Test if new, renamed and deleted rows show up in the choices """
+        self.assertEqual(get_choices(Genre), ((2, "Blues"), (1, "Jazz"), (3, "Rock")))
+
+        db.session.add(Genre(name="Funk"))
+        Genre.query.get(1).name = "Acid Jazz"
+        db.session.delete(Genre.query.get(3))
+        db.session.commit()
+
+        self.assertEqual(
+            get_choices(Genre), ((1, "Acid Jazz"), (2, "Blues"), (4, "Funk"))
+        )
+
+    def test_form_choices_ignore_rolled_back_changes(self):
+        """ Test if choices cached before a rollback are kept """
+        choices = get_choices(Genre)
+
+        db.session.add(Genre(name="Funk"))
+        db.session.flush()
+        db.session.rollback()
+
+        self.assertIs(get_choices(Genre), choices)
+
+    def test_form_choices_expire_after_max_age(self):
+        """ Test if rows added by another process show up after CHOICES_MAX_AGE """
+        choices = get_choices(Genre)
+        # Core inserts skip the session events, like a write by another worker.
+        db.session.execute(Genre.__table__.insert().values(name="Funk"))
+        db.session.commit()
+
+        now = time.monotonic()
+        with mock.patch("time.monotonic", return_value=now):
+            self.assertIs(get_choices(Genre), choices)
+        later = now + app.config["CHOICES_MAX_AGE"]
+        with mock.patch("time.monotonic", return_value=later):
+            self.assertIn((4, "Funk"), get_choices(Genre))
+
+    def test_show_submissions_validate_against_current_rows(self):
+        """ Test if a show for an artist added elsewhere is not rejected """
+        self.client().get("/shows/create")
+        db.session.execute(
+            Artist.__table__.insert().values(
+                name="Matt Quevedo", city="New York", state="NY", phone="300-400-5000"
+            )
+        )
+        db.session.commit()
+        artist_id = db.session.query(db.func.max(Artist.id)).scalar()
+
+        app.config["WTF_CSRF_ENABLED"] = False
+        try:
+            self.client().post(
+                "/shows/create",
+                data={
+                    "artist": artist_id,
+                    "venue": self.venue.id,
+                    "start_time": "2035-04-01 20:00:00",
+                },
+            )
+        finally:
+            app.config["WTF_CSRF_ENABLED"] = True
+        self.assertEqual(Show.query.filter_by(artist_id=artist_id).count(), 1)
+
+    """
+    Genre Associations
+    """
+
+    def test_set_model_genres_writes_only_changed_associations(self):
+        """ Test if editing genres batches one delete and one insert """
+        set_model_genres(["1", "2"], self.venue)
+        db.session.commit()
+
+        def edit_genres():
+            set_model_genres(["2", "3", "4", "5"], self.venue)
+            db.session.flush()
+
+        db.session.add_all([Genre(name="Funk"), Genre(name="Soul")])
+        db.session.commit()
+        db.session.refresh(self.venue)
+        statements = self.capture_statements(edit_genres)
+        statements = [statement.split()[0] for statement, _ in statements]
+        db.session.commit()
+
+        # One load each for the requested and the existing genres, then one
+        # executemany each for the removed and the added associations.
+        self.assertEqual(statements, ["SELECT", "SELECT", "DELETE", "INSERT"])
+        self.assertEqual(
+            sorted(genre.id for genre in Venue.query.get(self.venue.id).genres),
+            [2, 3, 4, 5],
+        )
+
+    def test_set_model_genres_without_changes_writes_nothing(self):
+        """ Test if resubmitting the same genres does not touch associations """
+        set_model_genres(["1", "2"], self.artist)
+        db.session.commit()
+
+        def edit_genres():
+            set_model_genres(["2", "1"], self.artist)
+            db.session.flush()
+
+        statements = self.capture_statements(edit_genres)
+
+        self.assertTrue(all(s.startswith("SELECT") for s, _ in statements))
+
+    """
+    Filters
+    """
+
+    def test_datetime_filter_formats_like_babel(self):
+        """ Test if the datetime filter matches Babel for datetimes and strings """
+        pattern = "EEEE MMMM, d, y 'at' h:mma"
+        naive = datetime(2026, 5, 1, 20, 30)
+        aware = naive.replace(tzinfo=timezone(timedelta(hours=-7)))
+
+        for value in (naive, aware, "05/01/26, 20:30"):
+            self.assertEqual(
+                format_datetime(value, "full"),
+                babel.dates.format_datetime(naive, pattern),
+            )
+        self.assertEqual(
+            format_datetime(naive, "short"), babel.dates.format_datetime(naive, "short")
+        )
+
+    def test_datetime_filter_keeps_timezones_apart(self):
+        """ Test if the same instant in different timezones formats in each zone """
+        instant = datetime(2026, 5, 1, 20, 30, tzinfo=timezone.utc)
+        eastern = instant.astimezone(timezone(timedelta(hours=-4)))
+        pacific = instant.astimezone(timezone(timedelta(hours=-7)))
+
+        for value in (eastern, pacific, eastern):
+            self.assertEqual(
+                format_datetime(value, "full"),
+                babel.dates.format_datetime(
+                    value.replace(tzinfo=None), "EEEE MMMM, d, y 'at' h:mma"
+                ),
+            )
+        self.assertNotEqual(
+            format_datetime(eastern, "HH:mm"), format_datetime(pacific, "HH:mm")
+        )
+
+    def test_show_pages_format_start_times(self):
+        """ Test if show listings render formatted start times """
+        show = Show.query.order_by(Show.start_time.desc()).first()
+        formatted = format_datetime(show.start_time, "full").encode()
+
+        self.assertIn(formatted, self.client().get("/shows").data)
+        self.assertIn(formatted, self.client().get(f"/venues/{self.venue.id}").data)
+        self.assertIn(formatted, self.client().get(f"/artists/{self.artist.id}").data)
+
+    """
+    Bulk Import
+    """
+
+    def import_file(self, kind, suffix, content, *args):
+        """Writes content to a file and runs the import command on it."""
+        with tempfile.NamedTemporaryFile("w", suffix=suffix, delete=False) as f:
+            f.write(content)
+        self.addCleanup(os.remove, f.name)
+        return app.test_cli_runner().invoke(args=["import", kind, f.name, *args])
+
+    def test_import_venues_reports_invalid_rows(self):
+        """ Test if valid venues are imported and invalid rows are reported """
+        get_choices(Venue)
+        get_name_index(Venue)
+        content = (
+            "name,city,state,address,phone,genres,seeking_talent\n"
+            'Blue Note,New York,NY,131 West Street,212-475-8592,"Jazz, blues",False\n'
+            "Bad Phone,New York,NY,1 Main Street,555,Jazz,False\n"
+            "Cafe Wha,New York,NY,115 MacDougal Street,212-254-3706,Rock,False\n"
+            "Unknown Genre,New York,NY,1 Main Street,212-254-3706,Polka,False\n"
+        )
+
+        result = self.import_file("venues", ".csv", content, "--batch-size", "2")
+
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIn("Imported 2 venues, skipped 0 existing, 2 failed.", result.output)
+        self.assertIn(":3: Phone number is invalid", result.output)
+        self.assertIn(":5: Unknown genre: Polka", result.output)
+        venue = Venue.query.filter_by(name="Blue Note").one()
+        self.assertEqual(
+            sorted(genre.name for genre in venue.genres), ["Blues", "Jazz"]
+        )
+        self.assertIn((venue.id, "Blue Note"), get_choices(Venue))
+        self.assertEqual(get_name_index(Venue).search("blue")[1], 1)
+
+    def test_import_shows_skips_rows_the_database_rejects(self):
+        """ Test if shows for unknown artists and duplicate shows are reported """
+        start_time = (datetime.now() + timedelta(days=7)).strftime("%Y-%m-%d %H:%M:%S")
+        show = f'"venue": {self.venue.id}, "start_time": "{start_time}"'
+        content = (
+            f'{{"artist": {self.artist.id}, {show}}}\n'
+            f'{{"artist": 999, {show}}}\n'
+            "not json\n"
+            f'{{"artist": {self.artist.id}, {show}}}\n'
+        )
+
+        result = self.import_file("shows", ".jsonl", content)
+
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIn("Imported 1 shows, skipped 0 existing, 3 failed.", result.output)
+        self.assertIn(":2: Not a valid choice", result.output)
+        self.assertIn(":3: Invalid JSON", result.output)
+        self.assertIn(":4: ", result.output)
+        self.assertEqual(Show.query.count(), 5)
+
+
+class TrigramIndexTestCase(unittest.TestCase):
+    """This class represents the in-process name index test case"""
+
+    def setUp(self):
+        self.index = TrigramIndex()
+        self.index.load(
+            [
+                (1, "The Musical Hop"),
+                (2, "Hop"),
+                (3, "Hop House"),
+                (4, "Park Square Live Music & Coffee"),
+                (5, "Hip Hop"),
+                (6, "Hop House"),
+            ]
+        )
+
+    def test_best_matches_come_first(self):
+        """ Test if matches are ordered by distance, then name, then id """
+        matches, total = self.index.search("hop")
+        self.assertEqual(total, 5)
+        self.assertEqual(matches, sorted(matches))
+        self.assertEqual(matches[0], SearchMatch(0, "Hop", 2))
+        self.assertEqual([m.id for m in matches if m.name == "Hop House"], [3, 6])
+        self.assertNotIn(4, [m.id for m in matches])
+
+    def test_after_pages_through_every_match_once(self):
+        """ Test if paging with after returns each match exactly once, in order """
+        everything, total = self.index.search("hop")
+        for limit in (1, 2, 4):
+            seen = []
+            after = None
+            while True:
+                page, page_total = self.index.search("hop", after=after, limit=limit)
+                self.assertEqual(page_total, total)
+                if not page:
+                    break
+                seen.extend(page)
+                after = page[-1]
+            self.assertEqual(seen, everything)
+
+    def test_add_and_remove_replace_indexed_names(self):
+        """ Test if renamed and removed ids stop matching their old names """
+        self.index.add(2, "Jazz Cellar")
+        self.index.remove(5)
+
+        self.assertEqual([m.id for m in self.index.search("hop")[0]], [3, 6, 1])
+        matches, total = self.index.search("jazz")
+        self.assertEqual([(m.name, m.id) for m in matches], [("Jazz Cellar", 2)])
+        self.assertEqual(total, 1)
+        self.assertEqual(self.index.search("hip"), ([], 0))
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()
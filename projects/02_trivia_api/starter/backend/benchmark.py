@@ -0,0 +1,464 @@
+"""
+Benchmarks for the Trivia API's data access paths.
+
+Usage:
+    python benchmark.py categories --questions 100000
+    python benchmark.py endpoints --questions 100000 --workers 4 --output run.json
+
+The scratch database is a SQLite file in the temp directory. Set
+BENCHMARK_DATABASE_URL to run against another database instead.
+!!NOTE the questions and categories tables in that database are dropped.
+"""
+
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from collections import namedtuple
+
+from sqlalchemy import (
+    Column,
+    Integer,
+    MetaData,
+    String,
+    Table,
+    create_engine,
+    event,
+    func,
+    select,
+    text,
+)
+
+from flaskr import create_app
+from models import Category, Question, db
+
+CATEGORIES = ["Science", "Art", "Geography", "History", "Entertainment", "Sports"]
+SEED_BATCH_SIZE = 10000
+
+# ----------------------------------------------------------------------------#
+# Measurement
+# ----------------------------------------------------------------------------#
+
+
+def measure(label, fn, repeat):
+    """Runs fn repeat times and prints its latency."""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+
+    print(
+        "{:<24} median={:9.3f}ms best={:9.3f}ms".format(
+            label, statistics.median(timings), min(timings)
+        )
+    )
+
+
+# ----------------------------------------------------------------------------#
+# Category Pages
+# ----------------------------------------------------------------------------#
+
+# The questions table before category became an indexed integer foreign key.
+legacy_metadata = MetaData()
+legacy_categories = Table(
+    "categories",
+    legacy_metadata,
+    Column("id", Integer, primary_key=True),
+    Column("type", String),
+)
+legacy_questions = Table(
+    "questions",
+    legacy_metadata,
+    Column("id", Integer, primary_key=True),
+    Column("question", String),
+    Column("answer", String),
+    Column("category", String),
+    Column("difficulty", Integer),
+)
+
+
+def seed_questions(engine, categories, questions, num_questions, category_value):
+    rng = random.Random(0)
+    with engine.begin() as connection:
+        connection.execute(
+            categories.insert(),
+            [{"id": i, "type": name} for i, name in enumerate(CATEGORIES, start=1)],
+        )
+        # Insert in batches, so a million questions do not need to fit in memory.
+        for start in range(1, num_questions + 1, SEED_BATCH_SIZE):
+            rows = [
+                {
+                    "id": question_id,
+                    "question": "Question {}?".format(question_id),
+                    "answer": "Answer {}".format(question_id),
+                    "category": category_value(rng.randint(1, len(CATEGORIES))),
+                    "difficulty": rng.randint(1, 5),
+                }
+                for question_id in range(
+                    start, min(start + SEED_BATCH_SIZE, num_questions + 1)
+                )
+            ]
+            connection.execute(questions.insert(), rows)
+
+        if engine.dialect.name == "postgresql":
+            # Ids were given explicitly, so move the sequences past them.
+            for table in (categories, questions):
+                connection.execute(
+                    text(
+                        "SELECT setval(pg_get_serial_sequence('{0}', 'id'), "
+                        "(SELECT max(id) FROM {0}))".format(table.name)
+                    )
+                )
+
+
+def bench_category_queries(engine, questions, category, page, repeat):
+    """Times the queries GET /categories/<id>/questions and /quizzes run."""
+    in_category = questions.c.category == category
+
+    def first_page():
+        engine.execute(
+            select([questions]).where(in_category).order_by(questions.c.id).limit(10)
+        ).fetchall()
+
+    def deep_page():
+        engine.execute(
+            select([questions])
+            .where(in_category)
+            .order_by(questions.c.id)
+            .offset((page - 1) * 10)
+            .limit(10)
+        ).fetchall()
+
+    def count():
+        engine.execute(select([func.count(questions.c.id)]).where(in_category)).scalar()
+
+    def quiz_pick():
+        engine.execute(
+            select([questions.c.id]).where(in_category).order_by(func.random()).limit(1)
+        ).scalar()
+
+    measure("  first page", first_page, repeat)
+    measure("  page {}".format(page), deep_page, repeat)
+    measure("  count", count, repeat)
+    measure("  random quiz question", quiz_pick, repeat)
+
+
+def bench_categories(args, database_url):
+    engine = create_engine(database_url)
+    current_metadata = Question.__table__.metadata
+    schemas = [
+        (
+            "string category, no index",
+            legacy_metadata,
+            legacy_categories,
+            legacy_questions,
+            str,
+        ),
+        (
+            "integer foreign key, indexed",
+            current_metadata,
+            Category.__table__,
+            Question.__table__,
+            int,
+        ),
+    ]
+    print(
+        "/categories/<id>/questions: {} questions in {} categories".format(
+            args.questions, len(CATEGORIES)
+        )
+    )
+
+    for label, metadata, categories, questions, category_value in schemas:
+        metadata.drop_all(engine)
+        metadata.create_all(engine)
+        seed_questions(engine, categories, questions, args.questions, category_value)
+        print(label)
+        bench_category_queries(
+            engine, questions, category_value(1), args.page, args.repeat
+        )
+        metadata.drop_all(engine)
+
+
+# ----------------------------------------------------------------------------#
+# Endpoints
+# ----------------------------------------------------------------------------#
+
+# A request to an endpoint. send(client, n) sends the n-th request; if given,
+# prepare(client, n) runs untimed before it and returns what to pass as n.
+Scenario = namedtuple("Scenario", "name send prepare max_requests")
+Scenario.__new__.__defaults__ = (None, None)
+
+# Requests run with tracemalloc on, one at a time, per endpoint.
+ALLOCATION_SAMPLES = 20
+
+
+def percentiles(timings):
+    if len(timings) < 2:
+        return {"p50": timings[0], "p95": timings[0], "p99": timings[0]}
+    cuts = statistics.quantiles(timings, n=100, method="inclusive")
+    return {"p50": cuts[49], "p95": cuts[94], "p99": cuts[98]}
+
+
+def endpoint_scenarios(num_questions):
+    """Returns a scenario for every route of the app."""
+    pages = max(min(num_questions // 10, 50), 1)
+    new_question = {
+        "question": "Which benchmark created this question?",
+        "answer": "The endpoints benchmark",
+        "category": 1,
+        "difficulty": 3,
+    }
+    bulk_body = "\n".join(json.dumps(new_question) for _ in range(10))
+    # Questions the create scenario adds, for the delete scenario to remove.
+    created_ids = []
+
+    def post_question(client):
+        return client.post("/questions?return=minimal", json=new_question)
+
+    def create(client, _):
+        response = post_question(client)
+        if response.status_code == 200:
+            created_ids.append(response.get_json()["created_id"])
+        return response
+
+    def created_question(client, _):
+        try:
+            return created_ids.pop()
+        except IndexError:
+            return post_question(client).get_json()["created_id"]
+
+    def list_etag(client, _):
+        return client.get("/questions").headers["ETag"]
+
+    def quiz_session(client, n):
+        response = client.post(
+            "/quizzes/sessions", json={"quiz_category": {"id": n % 7}}
+        )
+        return response.get_json()["session_id"]
+
+    return [
+        Scenario("GET /categories", lambda client, _: client.get("/categories")),
+        Scenario(
+            "GET /questions",
+            lambda client, n: client.get("/questions?page={}".format(n % pages + 1)),
+        ),
+        Scenario(
+            "GET /questions (If-None-Match)",
+            lambda client, etag: client.get(
+                "/questions", headers={"If-None-Match": etag}
+            ),
+            list_etag,
+        ),
+        Scenario(
+            "GET /categories/<id>/questions",
+            lambda client, n: client.get(
+                "/categories/{}/questions".format(n % len(CATEGORIES) + 1)
+            ),
+        ),
+        Scenario(
+            "POST /questions-search",
+            lambda client, n: client.post(
+                "/questions-search", json={"searchTerm": "question {}".format(n)}
+            ),
+        ),
+        Scenario("POST /questions", create),
+        Scenario(
+            "DELETE /questions/<id>",
+            lambda client, question_id: client.delete(
+                "/questions/{}?return=minimal".format(question_id)
+            ),
+            created_question,
+        ),
+        Scenario(
+            "POST /questions/bulk",
+            lambda client, _: client.post("/questions/bulk", data=bulk_body),
+        ),
+        Scenario(
+            "GET /questions/export",
+            lambda client, _: client.get("/questions/export"),
+            max_requests=5,
+        ),
+        Scenario(
+            "POST /quizzes",
+            lambda client, n: client.post(
+                "/quizzes",
+                json={
+                    "previous_questions": list(range(1, n % 20 + 1)),
+                    "quiz_category": {"id": n % 7},
+                },
+            ),
+        ),
+        Scenario(
+            "POST /quizzes/sessions",
+            lambda client, n: client.post(
+                "/quizzes/sessions", json={"quiz_category": {"id": n % 7}}
+            ),
+        ),
+        Scenario(
+            "POST /quizzes/sessions/<id>/next",
+            lambda client, session_id: client.post(
+                "/quizzes/sessions/{}/next".format(session_id)
+            ),
+            quiz_session,
+        ),
+    ]
+
+
+class QueryCounter:
+    """Counts the statements each thread executes."""
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def reset(self):
+        self._local.count = 0
+
+    @property
+    def count(self):
+        return getattr(self._local, "count", 0)
+
+    def __call__(self, *args):
+        self._local.count = self.count + 1
+
+
+def run_scenario(app, scenario, requests, workers, queries):
+    """Sends requests from concurrent workers; returns the results as a dict."""
+    timings = []
+    query_counts = []
+    errors = []
+    lock = threading.Lock()
+
+    def work(worker):
+        client = app.test_client()
+        for n in range(worker, requests, workers):
+            prepared = scenario.prepare(client, n) if scenario.prepare else n
+            queries.reset()
+            start = time.perf_counter()
+            response = scenario.send(client, prepared)
+            # Read the whole body, so streamed responses are timed too.
+            response.get_data()
+            elapsed = (time.perf_counter() - start) * 1000
+            response.close()
+            with lock:
+                timings.append(elapsed)
+                query_counts.append(queries.count)
+                if response.status_code >= 400:
+                    errors.append(response.status_code)
+
+    threads = [threading.Thread(target=work, args=(i,)) for i in range(workers)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    result = {
+        "requests": len(timings),
+        "errors": len(errors),
+        "throughput_rps": len(timings) / elapsed,
+        "latency_ms": dict(percentiles(timings), mean=statistics.mean(timings)),
+        "queries_per_request": statistics.mean(query_counts),
+    }
+    result["allocations_per_request"] = measure_allocations(
+        app, scenario, min(ALLOCATION_SAMPLES, requests)
+    )
+    return result
+
+
+def measure_allocations(app, scenario, samples):
+    """Returns the median bytes a request allocates at its peak and keeps."""
+    client = app.test_client()
+    peaks = []
+    retained = []
+    tracemalloc.start()
+    try:
+        for n in range(samples):
+            prepared = scenario.prepare(client, n) if scenario.prepare else n
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+            response = scenario.send(client, prepared)
+            response.get_data()
+            response.close()
+            current, peak = tracemalloc.get_traced_memory()
+            peaks.append(peak - before)
+            retained.append(current - before)
+    finally:
+        tracemalloc.stop()
+    return {
+        "peak_bytes": statistics.median(peaks),
+        "retained_bytes": statistics.median(retained),
+    }
+
+
+def bench_endpoints(args, database_url):
+    engine = create_engine(database_url)
+    metadata = Question.__table__.metadata
+    metadata.drop_all(engine)
+    metadata.create_all(engine)
+    seed_questions(engine, Category.__table__, Question.__table__, args.questions, int)
+    engine.dispose()
+
+    app = create_app({"DATABASE_PATH": database_url})
+    queries = QueryCounter()
+    with app.app_context():
+        event.listen(db.engine, "before_cursor_execute", queries)
+
+    report = {
+        "database": engine.dialect.name,
+        "questions": args.questions,
+        "workers": args.workers,
+        "endpoints": {},
+    }
+    for scenario in endpoint_scenarios(args.questions):
+        requests = min(args.requests, scenario.max_requests or args.requests)
+        print("{:<36} {} requests".format(scenario.name, requests), file=sys.stderr)
+        report["endpoints"][scenario.name] = run_scenario(
+            app, scenario, requests, args.workers, queries
+        )
+
+    output = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+# ----------------------------------------------------------------------------#
+# Launch
+# ----------------------------------------------------------------------------#
+
+BENCHMARKS = {
+    "categories": bench_categories,
+    "endpoints": bench_endpoints,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("benchmark", choices=sorted(BENCHMARKS))
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--questions", type=int, default=100000)
+    parser.add_argument("--page", type=int, default=100)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--output", help="write the endpoints report to a file")
+    args = parser.parse_args()
+
+    database_url = os.environ.get(
+        "BENCHMARK_DATABASE_URL",
+        "sqlite:///" + os.path.join(tempfile.gettempdir(), "trivia_benchmark.db"),
+    )
+    BENCHMARKS[args.benchmark](args, database_url)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,14 +2,33 @@
 # Imports
 # ----------------------------------------------------------------------------#
 import os
-from flask import Flask, request, abort, jsonify
+import json
+import functools
+from flask import Flask, Response, request, abort, jsonify, stream_with_context
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
+from sqlalchemy import func
 import random
-
-from models import setup_db, Question, Category
+import secrets
+import threading
+from collections import OrderedDict
+
+from models import (
+    setup_db,
+    add_question_listener,
+    database_path,
+    db,
+    Question,
+    Category,
+)
+from .quiz_sessions import MemoryQuizSessionStore
+from .search import QuestionSearch
 
 QUESTIONS_PER_PAGE = 10
+# Rows per executemany of a bulk import, and rows fetched at a time by an export.
+BULK_BATCH_SIZE = 1000
+# A bulk import stops validating after this many invalid rows.
+MAX_BULK_ERRORS = 100
 
 # ----------------------------------------------------------------------------#
 # Helper Functions
@@ -17,14 +36,351 @@ QUESTIONS_PER_PAGE = 10
 
 
 def paginate_questions(request, selection):
-    page = request.args.get("page", 1, type=int)
-    start = (page - 1) * QUESTIONS_PER_PAGE
-    end = start + QUESTIONS_PER_PAGE
-
-    questions = [question.format() for question in selection]
-    current_questions = questions[start:end]
-
-    return current_questions
+    """
+    Loads and formats the requested page of a question query.
+
+    The page is cut out in SQL, so only its questions are loaded. Pages are
+    numbered by `page` (LIMIT/OFFSET), or follow the question id given as
+    `after_id`, which stays fast however deep the client pages.
+    """
+    selection = selection.order_by(Question.id)
+    after_id = request.args.get("after_id", None, type=int)
+    if after_id is not None:
+        selection = selection.filter(Question.id > after_id)
+    else:
+        page = request.args.get("page", 1, type=int)
+        if page < 1:
+            return []
+        selection = selection.offset((page - 1) * QUESTIONS_PER_PAGE)
+
+    questions = selection.limit(QUESTIONS_PER_PAGE).all()
+    return [question.format() for question in questions]
+
+
+def wants_minimal_response(request):
+    """
+    Tells if the client asked for a minimal response to a write, with
+    `?return=minimal` or a `Prefer: return=minimal` header.
+    """
+    if request.args.get("return") == "minimal":
+        return True
+    preferences = request.headers.get("Prefer", "").split(",")
+    return "return=minimal" in (preference.strip() for preference in preferences)
+
+
+def minimal_response(body, data_version):
+    """
+    Returns a write's body along with the ETag the question list has now, so
+    the client only needs to reload the list when the ETag it has differs.
+    """
+    response = jsonify(body)
+    data_version.sync()
+    response.set_etag(data_version.etag())
+    response.headers["Preference-Applied"] = "return=minimal"
+    return response
+
+
+def parse_question_row(line, category_ids):
+    """
+    Validates a JSON line of a bulk import and returns the values to insert.
+
+    Raises ValueError explaining what is wrong with the row.
+    """
+    try:
+        row = json.loads(line)
+    except ValueError:
+        raise ValueError("invalid JSON")
+    if not isinstance(row, dict):
+        raise ValueError("expected a JSON object")
+
+    for field in ("question", "answer"):
+        if not isinstance(row.get(field), str) or not row[field].strip():
+            raise ValueError("{} is required".format(field))
+    try:
+        category = int(row.get("category"))
+        difficulty = int(row.get("difficulty"))
+    except (TypeError, ValueError):
+        raise ValueError("category and difficulty must be integers")
+    if category not in category_ids:
+        raise ValueError("unknown category {}".format(category))
+    if not 1 <= difficulty <= 5:
+        raise ValueError("difficulty must be between 1 and 5")
+
+    return {
+        "question": row["question"],
+        "answer": row["answer"],
+        "category": category,
+        "difficulty": difficulty,
+    }
+
+
+class DataVersion:
+    """
+    A version of the questions, increased by every committed change.
+
+    ETags are built from it, so clients can tell whether their question list
+    is still current without loading it again. Changes committed by this
+    process are counted as they happen. Changes committed by other processes,
+    like other app workers, are found by sync(), which compares the number of
+    questions and the highest question id with what it saw before and clears
+    the given caches when they differ. Both are part of the ETag too, so any
+    process creating or deleting a question changes the ETags of all of them.
+    A random token per process is part of the ETag, so ETags from before a
+    restart never match.
+    """
+
+    def __init__(self, caches=()):
+        self.caches = list(caches)
+        self._lock = threading.Lock()
+        self._token = secrets.token_hex(4)
+        self._version = 0
+        self._fingerprint = None
+
+    def bump(self):
+        with self._lock:
+            self._version += 1
+
+    def sync(self):
+        """Picks up the questions other processes created or deleted."""
+        fingerprint = tuple(
+            db.session.query(func.count(Question.id), func.max(Question.id)).one()
+        )
+        with self._lock:
+            changed = self._fingerprint not in (None, fingerprint)
+            self._fingerprint = fingerprint
+        if changed:
+            for cache in self.caches:
+                cache.clear()
+
+    def etag(self):
+        if self._fingerprint is None:
+            self.sync()
+        count, max_id = self._fingerprint
+        return "{}-{}-{}-{}".format(self._token, self._version, count, max_id)
+
+    def __call__(self, action, question, previous_category):
+        self.bump()
+
+
+class ResponseCache:
+    """
+    Caches response bodies of read endpoints for the current data version.
+
+    Bodies are stored by (endpoint, arguments, version). Once the version
+    changes, the bodies of older versions can never be served again, so they
+    are dropped. At most max_entries bodies are kept, least recently used
+    first out.
+    """
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._version = None
+        self._bodies = OrderedDict()
+
+    def get(self, version, key):
+        with self._lock:
+            if version != self._version or key not in self._bodies:
+                return None
+            self._bodies.move_to_end(key)
+            return self._bodies[key]
+
+    def set(self, version, key, body):
+        with self._lock:
+            if version != self._version:
+                self._version = version
+                self._bodies.clear()
+            self._bodies[key] = body
+            if len(self._bodies) > self.max_entries:
+                self._bodies.popitem(last=False)
+
+
+class QuestionMetadata:
+    """
+    Caches the category map and the question counts the list endpoints return.
+
+    Everything is loaded with two queries on first use. Afterwards the counts
+    are kept current by Question.insert(), update() and delete(), which call
+    the cache as a question listener. Changes made without those methods are
+    picked up after clear(). DataVersion.sync() clears the cache when another
+    process created or deleted questions.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._categories = {}
+        self._counts = {}
+        self._total = 0
+
+    def categories(self):
+        """Returns the map of category id to type, ordered by id."""
+        self._load()
+        return self._categories
+
+    def total_questions(self, category=None):
+        """Returns the number of questions, in all categories or in one."""
+        self._load()
+        if category is None:
+            return self._total
+        return self._counts.get(str(category), 0)
+
+    def clear(self):
+        with self._lock:
+            self._loaded = False
+
+    def __call__(self, action, question, previous_category):
+        with self._lock:
+            if not self._loaded:
+                return
+            if action in ("update", "delete"):
+                self._add(previous_category, -1)
+            if action in ("insert", "update"):
+                self._add(question.category, 1)
+
+    def _add(self, category, count):
+        category = str(category)
+        self._counts[category] = self._counts.get(category, 0) + count
+        self._total += count
+
+    def _load(self):
+        with self._lock:
+            if self._loaded:
+                return
+            categories = Category.query.order_by(Category.id).all()
+            self._categories = {category.id: category.type for category in categories}
+            counts = (
+                db.session.query(Question.category, func.count(Question.id))
+                .group_by(Question.category)
+                .all()
+            )
+            self._counts = {str(category): count for category, count in counts}
+            self._total = sum(self._counts.values())
+            self._loaded = True
+
+
+class IdArray:
+    """A set of ids that can also pick a random member in constant time."""
+
+    def __init__(self):
+        self._ids = []
+        self._positions = {}
+
+    def __len__(self):
+        return len(self._ids)
+
+    def add(self, item_id):
+        if item_id not in self._positions:
+            self._positions[item_id] = len(self._ids)
+            self._ids.append(item_id)
+
+    def remove(self, item_id):
+        # Move the last id into the gap, so removal does not shift the array.
+        position = self._positions.pop(item_id, None)
+        if position is None:
+            return
+        last_id = self._ids.pop()
+        if last_id != item_id:
+            self._ids[position] = last_id
+            self._positions[last_id] = position
+
+    def sample(self):
+        return self._ids[random.randrange(len(self._ids))]
+
+    def to_list(self):
+        return list(self._ids)
+
+
+class QuizQuestionSelector:
+    """
+    Picks random quiz questions without loading the questions table.
+
+    The question ids of every category are kept in memory, loaded on first use
+    and kept current as a question listener. A question is picked by sampling
+    random ids and skipping previous questions. Once most of a category has
+    been played and sampling keeps hitting previous questions, one SQL query
+    picks among the remaining ones instead.
+    """
+
+    SAMPLE_ATTEMPTS = 8
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._all = IdArray()
+        self._categories = {}
+
+    def count(self, category=None):
+        """Returns the number of questions, in all categories or in one."""
+        self._load()
+        return len(self._ids(category))
+
+    def pick(self, category=None, previous_ids=()):
+        """
+        Returns the id of a random question not in previous_ids, or None if
+        every question in the category has been played.
+        """
+        self._load()
+        previous_ids = set(previous_ids)
+        with self._lock:
+            ids = self._ids(category)
+            if len(previous_ids) < len(ids):
+                for _ in range(self.SAMPLE_ATTEMPTS):
+                    question_id = ids.sample()
+                    if question_id not in previous_ids:
+                        return question_id
+
+        selection = db.session.query(Question.id)
+        if category is not None:
+            selection = selection.filter(Question.category == category)
+        if previous_ids:
+            selection = selection.filter(~Question.id.in_(previous_ids))
+        question_id = selection.order_by(func.random()).limit(1).scalar()
+        return question_id
+
+    def shuffled(self, category=None):
+        """Returns the ids of the questions in a category in random order."""
+        self._load()
+        with self._lock:
+            question_ids = self._ids(category).to_list()
+        random.shuffle(question_ids)
+        return question_ids
+
+    def clear(self):
+        with self._lock:
+            self._loaded = False
+
+    def __call__(self, action, question, previous_category):
+        with self._lock:
+            if not self._loaded:
+                return
+            if action in ("update", "delete"):
+                self._all.remove(question.id)
+                self._category(previous_category).remove(question.id)
+            if action in ("insert", "update"):
+                self._all.add(question.id)
+                self._category(question.category).add(question.id)
+
+    def _ids(self, category):
+        if category is None:
+            return self._all
+        return self._categories.get(str(category), IdArray())
+
+    def _category(self, category):
+        return self._categories.setdefault(str(category), IdArray())
+
+    def _load(self):
+        with self._lock:
+            if self._loaded:
+                return
+            self._all = IdArray()
+            self._categories = {}
+            for question_id, category in db.session.query(
+                Question.id, Question.category
+            ):
+                self._all.add(question_id)
+                self._category(category).add(question_id)
+            self._loaded = True
 
 
 def create_app(test_config=None):
@@ -32,13 +388,83 @@ def create_app(test_config=None):
     # App Configuration
     # ----------------------------------------------------------------------#
     app = Flask(__name__)
-    setup_db(app)
+    if test_config is not None:
+        app.config.from_mapping(test_config)
+    setup_db(app, app.config.get("DATABASE_PATH", database_path))
     CORS(app)
 
+    metadata = QuestionMetadata()
+    add_question_listener(metadata)
+    # Keep the cache alive as long as the app; the listener is held weakly.
+    app.extensions["question_metadata"] = metadata
+    quiz_selector = QuizQuestionSelector()
+    add_question_listener(quiz_selector)
+    app.extensions["quiz_selector"] = quiz_selector
+    question_search = QuestionSearch()
+    add_question_listener(question_search)
+    app.extensions["question_search"] = question_search
+    data_version = DataVersion([metadata, quiz_selector, question_search])
+    add_question_listener(data_version)
+    app.extensions["data_version"] = data_version
+    # Any QuizSessionStore can be configured, e.g. to share sessions in Redis.
+    if "QUIZ_SESSION_STORE" not in app.config:
+        app.config["QUIZ_SESSION_STORE"] = MemoryQuizSessionStore()
+    quiz_sessions = app.config["QUIZ_SESSION_STORE"]
+
+    response_cache = ResponseCache()
+
+    def versioned(view):
+        """
+        Serves a read endpoint by the version of the questions.
+
+        A request whose If-None-Match has the current ETag gets 304 Not
+        Modified without any database work beyond the version check every
+        request makes. Other successful responses are cached by endpoint,
+        query string and version, and served from there until a question
+        changes, in this process or another.
+        """
+
+        @functools.wraps(view)
+        def wrapper(**kwargs):
+            etag = data_version.etag()
+            if request.if_none_match.contains_weak(etag):
+                response = Response(status=304)
+                response.set_etag(etag)
+                return response
+
+            key = (
+                request.endpoint,
+                tuple(sorted(kwargs.items())),
+                request.query_string,
+            )
+            body = response_cache.get(etag, key)
+            if body is None:
+                response = view(**kwargs)
+                if response.status_code != 200:
+                    return response
+                body = response.get_data()
+                response_cache.set(etag, key, body)
+
+            response = Response(body, mimetype="application/json")
+            response.set_etag(etag)
+            return response
+
+        return wrapper
+
+    @app.before_request
+    def sync_data_version():
+        # One small query per request notices changes made by other workers.
+        data_version.sync()
+
     @app.after_request
     def after_request(response):
         response.headers.add(
-            "Access-Control-Allow-Headers", "Content-Type, Authorization"
+            "Access-Control-Allow-Headers",
+            "Content-Type, Authorization, Prefer, If-None-Match",
+        )
+        # Let the frontend read the ETag it compares to refresh lists lazily.
+        response.headers.add(
+            "Access-Control-Expose-Headers", "ETag, Preference-Applied"
         )
         response.headers.add(
             "Access-Control-Allow-Methods", "GET, POST, DELETE, OPTIONS"
@@ -51,33 +477,31 @@ def create_app(test_config=None):
     # ----------------------------------------------------------------------#
 
     @app.route("/categories", methods=["GET"])
+    @versioned
     def get_categories():
-        categories = Category.query.order_by(Category.id).all()
+        categories = metadata.categories()
 
         if len(categories) == 0:
             abort(404)
-        return jsonify(
-            {"categories": {category.id: category.type for category in categories}}
-        )
+        return jsonify({"categories": categories})
 
     # ----------------------------------------------------------------------#
     # Retrieve Questions
     # ----------------------------------------------------------------------#
 
     @app.route("/questions", methods=["GET"])
+    @versioned
     def get_questions():
-        selection = Question.query.order_by(Question.id).all()
-        current_questions = paginate_questions(request, selection)
-        categories = Category.query.order_by(Category.id).all()
+        current_questions = paginate_questions(request, Question.query)
 
         if len(current_questions) == 0:
             abort(404)
         return jsonify(
             {
                 "questions": current_questions,
-                "total_questions": len(Question.query.all()),
+                "total_questions": metadata.total_questions(),
                 "current_category": None,
-                "categories": {category.id: category.type for category in categories},
+                "categories": metadata.categories(),
             }
         )
 
@@ -94,9 +518,12 @@ def create_app(test_config=None):
                 abort(404)
 
             question.delete()
-            selection = Question.query.order_by(Question.id).all()
-            current_questions = paginate_questions(request, selection)
-            categories = Category.query.order_by(Category.id).all()
+            if wants_minimal_response(request):
+                return minimal_response(
+                    {"success": True, "deleted_id": question_id}, data_version
+                )
+
+            current_questions = paginate_questions(request, Question.query)
 
             if len(current_questions) == 0:
                 abort(404)
@@ -105,11 +532,9 @@ def create_app(test_config=None):
                     "success": True,
                     "deleted_id": question_id,
                     "questions": current_questions,
-                    "total_questions": len(Question.query.all()),
+                    "total_questions": metadata.total_questions(),
                     "current_category": None,
-                    "categories": {
-                        category.id: category.type for category in categories
-                    },
+                    "categories": metadata.categories(),
                 }
             )
         except Exception as e:
@@ -137,27 +562,108 @@ def create_app(test_config=None):
                 difficulty=new_difficulty,
             )
             question.insert()
+            if wants_minimal_response(request):
+                return minimal_response(
+                    {"success": True, "created_id": question.id}, data_version
+                )
 
-            selection = Question.query.order_by(Question.id).all()
-            current_questions = paginate_questions(request, selection)
-            categories = Category.query.order_by(Category.id).all()
+            current_questions = paginate_questions(request, Question.query)
 
             return jsonify(
                 {
                     "success": True,
                     "created_id": question.id,
                     "questions": current_questions,
-                    "total_questions": len(Question.query.all()),
+                    "total_questions": metadata.total_questions(),
                     "current_category": None,
-                    "categories": {
-                        category.id: category.type for category in categories
-                    },
+                    "categories": metadata.categories(),
                 }
             )
         except Exception as e:
             print(e)
             abort(422)
 
+    # ----------------------------------------------------------------------#
+    # Import and Export Questions
+    # ----------------------------------------------------------------------#
+
+    @app.route("/questions/bulk", methods=["POST"])
+    def create_questions_bulk():
+        """
+        Imports questions from a JSON-lines body, one question object per line.
+
+        Lines are read as they arrive and inserted with one executemany per
+        batch, all in one transaction: if any row is invalid, nothing is
+        imported and the invalid rows are returned.
+        """
+        category_ids = set(metadata.categories())
+        questions = Question.__table__
+        created = 0
+        errors = []
+        batch = []
+
+        try:
+            for line_number, line in enumerate(request.stream, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    row = parse_question_row(line, category_ids)
+                except ValueError as e:
+                    errors.append({"line": line_number, "message": str(e)})
+                    if len(errors) == MAX_BULK_ERRORS:
+                        break
+                    continue
+
+                # After the first error, rows are only validated.
+                if not errors:
+                    batch.append(row)
+                if len(batch) == BULK_BATCH_SIZE:
+                    db.session.execute(questions.insert(), batch)
+                    created += len(batch)
+                    batch = []
+
+            if errors:
+                db.session.rollback()
+                return (
+                    jsonify(
+                        {
+                            "success": False,
+                            "error": 422,
+                            "message": "unprocessable",
+                            "errors": errors,
+                        }
+                    ),
+                    422,
+                )
+            if batch:
+                db.session.execute(questions.insert(), batch)
+                created += len(batch)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            print(e)
+            abort(422)
+        finally:
+            # The inserts bypass Question.insert(), so reload the cached state.
+            for cache in (metadata, quiz_selector, question_search):
+                cache.clear()
+            data_version.bump()
+
+        return jsonify({"success": True, "created": created})
+
+    @app.route("/questions/export", methods=["GET"])
+    def export_questions():
+        """Streams every question as JSON lines, reading them in batches."""
+
+        def generate():
+            questions = Question.query.order_by(Question.id).yield_per(BULK_BATCH_SIZE)
+            for question in questions:
+                yield json.dumps(question.format()) + "\n"
+
+        return Response(
+            stream_with_context(generate()), mimetype="application/x-ndjson"
+        )
+
     # ----------------------------------------------------------------------#
     # Search Questions
     # ----------------------------------------------------------------------#
@@ -166,22 +672,19 @@ def create_app(test_config=None):
     def search_questions():
         body = request.get_json()
         search_term = body.get("searchTerm", None)
-        categories = Category.query.order_by(Category.id).all()
 
         try:
-            selection = Question.query.order_by(Question.id).filter(
-                Question.question.ilike("%{}%".format(search_term))
+            page = request.args.get("page", 1, type=int)
+            questions, total_questions = question_search.search(
+                search_term, page, QUESTIONS_PER_PAGE
             )
-            current_questions = paginate_questions(request, selection)
 
             return jsonify(
                 {
-                    "questions": current_questions,
-                    "total_questions": len(selection.all()),
+                    "questions": [question.format() for question in questions],
+                    "total_questions": total_questions,
                     "current_category": None,
-                    "categories": {
-                        category.id: category.type for category in categories
-                    },
+                    "categories": metadata.categories(),
                 }
             )
         except Exception as e:
@@ -193,19 +696,19 @@ def create_app(test_config=None):
     # ----------------------------------------------------------------------#
 
     @app.route("/categories/<int:category_id>/questions", methods=["GET"])
+    @versioned
     def get_questions_by_category(category_id):
-        selection = Question.query.filter(Question.category == category_id).all()
+        selection = Question.query.filter(Question.category == category_id)
         current_questions = paginate_questions(request, selection)
-        categories = Category.query.order_by(Category.id).all()
 
         if len(current_questions) == 0:
             abort(404)
         return jsonify(
             {
                 "questions": current_questions,
-                "total_questions": len(selection),
+                "total_questions": metadata.total_questions(category_id),
                 "current_category": category_id,
-                "categories": {category.id: category.type for category in categories},
+                "categories": metadata.categories(),
             }
         )
 
@@ -220,29 +723,64 @@ def create_app(test_config=None):
         quiz_category = body.get("quiz_category", None)
 
         try:
-            if quiz_category:
-                if quiz_category["id"] == 0:
-                    questions = Question.query.all()
-                else:
-                    questions = Question.query.filter(
-                        Question.category == quiz_category["id"]
-                    ).all()
-            if not questions:
+            category_id = int(quiz_category["id"])
+            # A category id of zero plays questions from all categories.
+            category = category_id if category_id != 0 else None
+            if quiz_selector.count(category) == 0:
                 return abort(422)
-            question_options = []
-            for question in questions:
-                if question.id not in previous_questions:
-                    question_options.append(question.format())
-            if len(question_options) != 0:
-                next_question = random.choice(question_options)
-                return jsonify({"question": next_question})
-            else:
+
+            question_id = quiz_selector.pick(category, previous_questions)
+            if question_id is None:
                 return jsonify({"question": False})
+            return jsonify({"question": Question.query.get(question_id).format()})
 
         except Exception as e:
             print(e)
             abort(422)
 
+    # ----------------------------------------------------------------------#
+    # Play Quiz Sessions
+    # ----------------------------------------------------------------------#
+
+    @app.route("/quizzes/sessions", methods=["POST"])
+    def create_quiz_session():
+        body = request.get_json()
+        quiz_category = body.get("quiz_category", None)
+
+        try:
+            category_id = int(quiz_category["id"])
+        except (KeyError, TypeError, ValueError):
+            abort(422)
+
+        # A category id of zero plays questions from all categories.
+        category = category_id if category_id != 0 else None
+        question_ids = quiz_selector.shuffled(category)
+        if not question_ids:
+            abort(422)
+
+        return jsonify(
+            {
+                "success": True,
+                "session_id": quiz_sessions.create(question_ids),
+                "total_questions": len(question_ids),
+            }
+        )
+
+    @app.route("/quizzes/sessions/<session_id>/next", methods=["POST"])
+    def get_next_session_question(session_id):
+        while True:
+            try:
+                question_id = quiz_sessions.next_question_id(session_id)
+            except KeyError:
+                abort(404)
+
+            if question_id is None:
+                return jsonify({"success": True, "question": False})
+            question = Question.query.get(question_id)
+            # Skip questions deleted since the session started.
+            if question is not None:
+                return jsonify({"success": True, "question": question.format()})
+
     # ----------------------------------------------------------------------#
     # Error Handlers
     # ----------------------------------------------------------------------#
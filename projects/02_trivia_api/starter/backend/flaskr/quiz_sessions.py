@@ -0,0 +1,120 @@
+"""
+Stores for server-side quiz sessions.
+
+A quiz session is the shuffled sequence of question ids a quiz plays through,
+so the client no longer sends every previous question each round. Any object
+with the methods of QuizSessionStore can keep them; the in-process store is
+the default, and RedisQuizSessionStore shares sessions between workers.
+"""
+import secrets
+import threading
+import time
+from collections import OrderedDict
+
+
+class QuizSessionStore:
+    """The interface of quiz session stores."""
+
+    def create(self, question_ids):
+        """Stores a new session playing question_ids in order; returns its id."""
+        raise NotImplementedError
+
+    def next_question_id(self, session_id):
+        """
+        Returns the next question id of a session, or None once every question
+        has been played. Raises KeyError if the session does not exist or expired.
+        """
+        raise NotImplementedError
+
+
+def new_session_id():
+    return secrets.token_urlsafe(16)
+
+
+class MemoryQuizSessionStore(QuizSessionStore):
+    """
+    Keeps sessions in memory, for at most ttl seconds after their last use.
+
+    Once max_sessions are stored, creating one evicts the least recently used.
+    """
+
+    def __init__(self, max_sessions=10000, ttl=3600, clock=time.monotonic):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self._clock = clock
+        self._lock = threading.Lock()
+        # Session id -> [expires at, question ids, position], least recently used first.
+        self._sessions = OrderedDict()
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def create(self, question_ids):
+        session_id = new_session_id()
+        with self._lock:
+            now = self._clock()
+            self._evict(now)
+            self._sessions[session_id] = [now + self.ttl, list(question_ids), 0]
+        return session_id
+
+    def next_question_id(self, session_id):
+        with self._lock:
+            now = self._clock()
+            session = self._sessions.get(session_id)
+            if session is None or session[0] <= now:
+                self._sessions.pop(session_id, None)
+                raise KeyError(session_id)
+
+            self._sessions.move_to_end(session_id)
+            session[0] = now + self.ttl
+            _, question_ids, position = session
+            if position >= len(question_ids):
+                return None
+            session[2] = position + 1
+            return question_ids[position]
+
+    def _evict(self, now):
+        # Sessions are ordered by last use, so expired ones are at the front.
+        while self._sessions:
+            session_id, (expires_at, _, _) = next(iter(self._sessions.items()))
+            if expires_at > now and len(self._sessions) < self.max_sessions:
+                return
+            del self._sessions[session_id]
+
+
+class RedisQuizSessionStore(QuizSessionStore):
+    """
+    Keeps sessions in Redis, so every worker of the app can serve them.
+
+    client can be a redis.Redis instance or anything else with its rpush,
+    incr, lindex, exists and expire commands. Each session is a list of
+    question ids and a counter of the questions played, both expiring ttl
+    seconds after the last use.
+    """
+
+    def __init__(self, client, ttl=3600, prefix="quiz-session:"):
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def create(self, question_ids):
+        session_id = new_session_id()
+        key = self.prefix + session_id
+        self.client.rpush(key, *question_ids)
+        self.client.incr(key + ":position", 0)
+        self._touch(key)
+        return session_id
+
+    def next_question_id(self, session_id):
+        key = self.prefix + session_id
+        if not self.client.exists(key):
+            raise KeyError(session_id)
+
+        position = self.client.incr(key + ":position") - 1
+        self._touch(key)
+        question_id = self.client.lindex(key, position)
+        return None if question_id is None else int(question_id)
+
+    def _touch(self, key):
+        self.client.expire(key, self.ttl)
+        self.client.expire(key + ":position", self.ttl)
@@ -0,0 +1,172 @@
+"""
+Full-text search over the question and answer text of questions.
+
+On Postgres, searches are answered by the GIN index create_search_index()
+builds over SEARCH_DOCUMENT and ranked with ts_rank. Other databases, like
+SQLite in tests, fall back to an in-memory inverted index that is kept
+current as a question listener.
+
+Both paths match every word of the search term as a word prefix, so "sing"
+finds "Sings". The fallback does not stem words or drop stop words, so its
+matches can differ slightly from Postgres for some word forms. On Postgres,
+a term made only of stop words, like "the", matches every question.
+"""
+import re
+import threading
+from bisect import bisect_left
+from collections import defaultdict
+
+from sqlalchemy import func, literal_column
+
+from models import SEARCH_CONFIG, SEARCH_DOCUMENT, db, Question
+
+WORD_PATTERN = re.compile(r"\w+")
+
+
+def words(text):
+    return WORD_PATTERN.findall((text or "").lower())
+
+
+def searchable_text(question, answer):
+    return "{} {}".format(question or "", answer or "")
+
+
+class InvertedIndex:
+    """Maps each word to the ids of the questions using it and how often."""
+
+    def __init__(self):
+        self._postings = defaultdict(dict)
+        # All indexed words in order, to find the words starting with a prefix.
+        self._vocabulary = []
+        self._documents = {}
+
+    def add(self, question_id, text):
+        self.remove(question_id)
+        counts = defaultdict(int)
+        for word in words(text):
+            counts[word] += 1
+        for word, count in counts.items():
+            if word not in self._postings:
+                position = bisect_left(self._vocabulary, word)
+                self._vocabulary.insert(position, word)
+            self._postings[word][question_id] = count
+        self._documents[question_id] = list(counts)
+
+    def remove(self, question_id):
+        for word in self._documents.pop(question_id, ()):
+            postings = self._postings[word]
+            postings.pop(question_id, None)
+            if not postings:
+                del self._postings[word]
+                del self._vocabulary[bisect_left(self._vocabulary, word)]
+
+    def search(self, prefixes):
+        """
+        Returns the ids of the questions with a word starting with each prefix,
+        best match first, ranked by how often the prefixes occur.
+        """
+        scores = None
+        for prefix in prefixes:
+            prefix_scores = defaultdict(int)
+            vocabulary = self._vocabulary
+            position = bisect_left(vocabulary, prefix)
+            while position < len(vocabulary) and vocabulary[position].startswith(prefix):
+                for question_id, count in self._postings[vocabulary[position]].items():
+                    prefix_scores[question_id] += count
+                position += 1
+
+            if scores is None:
+                scores = prefix_scores
+            else:
+                scores = {
+                    question_id: score + prefix_scores[question_id]
+                    for question_id, score in scores.items()
+                    if question_id in prefix_scores
+                }
+        scores = scores or {}
+        return sorted(scores, key=lambda question_id: (-scores[question_id], question_id))
+
+
+class QuestionSearch:
+    """Finds the questions matching a search term, one page at a time."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._index = None
+
+    def search(self, term, page, per_page):
+        """
+        Returns the questions on the given page of the results for term, best
+        match first, and the total number of matches. A term without words
+        matches every question.
+        """
+        prefixes = words(term)
+        offset = max(page - 1, 0) * per_page
+        if not prefixes:
+            return self._list_all(offset, per_page)
+
+        if db.engine.dialect.name == "postgresql":
+            return self._search_postgres(prefixes, offset, per_page)
+        return self._search_index(prefixes, offset, per_page)
+
+    def _list_all(self, offset, per_page):
+        questions = Question.query.order_by(Question.id)
+        total = questions.with_entities(func.count(Question.id)).scalar()
+        return questions.offset(offset).limit(per_page).all(), total
+
+    def _search_postgres(self, prefixes, offset, per_page):
+        document = literal_column(SEARCH_DOCUMENT)
+        # Words only contain word characters, so they are safe tsquery terms.
+        query = func.to_tsquery(
+            literal_column(SEARCH_CONFIG),
+            " & ".join("{}:*".format(prefix) for prefix in prefixes),
+        )
+        matches = Question.query.filter(document.op("@@")(query))
+
+        total = matches.with_entities(func.count(Question.id)).scalar()
+        # English stop words like "the" are not indexed, so a term made only of
+        # them leaves an empty query; it matches every question, like a term
+        # without words.
+        if not total and not db.session.query(func.numnode(query)).scalar():
+            return self._list_all(offset, per_page)
+
+        questions = (
+            matches.order_by(func.ts_rank(document, query).desc(), Question.id)
+            .offset(offset)
+            .limit(per_page)
+            .all()
+        )
+        return questions, total
+
+    def _search_index(self, prefixes, offset, per_page):
+        with self._lock:
+            if self._index is None:
+                self._index = InvertedIndex()
+                for question_id, question, answer in db.session.query(
+                    Question.id, Question.question, Question.answer
+                ):
+                    self._index.add(question_id, searchable_text(question, answer))
+            question_ids = self._index.search(prefixes)
+
+        page_ids = question_ids[offset : offset + per_page]
+        questions = {}
+        if page_ids:
+            questions = {
+                question.id: question
+                for question in Question.query.filter(Question.id.in_(page_ids))
+            }
+        return [questions[i] for i in page_ids if i in questions], len(question_ids)
+
+    def clear(self):
+        with self._lock:
+            self._index = None
+
+    def __call__(self, action, question, previous_category):
+        with self._lock:
+            if self._index is None:
+                return
+            if action == "delete":
+                self._index.remove(question.id)
+            else:
+                text = searchable_text(question.question, question.answer)
+                self._index.add(question.id, text)
@@ -0,0 +1,92 @@
+"""
+Converts questions.category to an indexed integer foreign key to categories.
+
+Databases created by db.create_all() before the category became an integer
+store it as a string, with no foreign key and no index. This script converts
+the column in place, adds the foreign key and the (category, id) index
+the models now declare, and can safely be run again. Databases restored from
+trivia.psql already have the integer column and the foreign key, and only get
+the index.
+
+Nothing is changed if a question has a category that is not the id of an
+existing category; those questions are listed so they can be fixed first.
+
+Usage:
+    python migrate_question_categories.py [database_path]
+"""
+import sys
+
+from sqlalchemy import Integer, create_engine, inspect, text
+
+from models import database_path
+
+INDEX_NAME = "ix_questions_category_id"
+FOREIGN_KEY_NAME = "category"
+
+
+def find_invalid_categories(connection):
+    """Returns (id, category) of the questions whose category does not exist."""
+    return connection.execute(
+        text(
+            "SELECT id, category FROM questions "
+            "WHERE category IS NOT NULL AND category::text NOT IN "
+            "(SELECT id::text FROM categories) "
+            "ORDER BY id"
+        )
+    ).fetchall()
+
+
+def migrate(engine):
+    if engine.dialect.name != "postgresql":
+        raise SystemExit(
+            "Only Postgres databases need migrating; recreate other databases "
+            "with db.create_all()."
+        )
+
+    with engine.begin() as connection:
+        inspector = inspect(connection)
+        invalid = find_invalid_categories(connection)
+        if invalid:
+            for question_id, category in invalid:
+                print(
+                    "Question {} has unknown category {!r}".format(
+                        question_id, category
+                    )
+                )
+            raise SystemExit("No changes made; fix the categories above first.")
+
+        columns = {
+            column["name"]: column for column in inspector.get_columns("questions")
+        }
+        if not isinstance(columns["category"]["type"], Integer):
+            print("Converting questions.category to integer")
+            connection.execute(
+                text(
+                    "ALTER TABLE questions ALTER COLUMN category "
+                    "TYPE integer USING category::integer"
+                )
+            )
+
+        foreign_keys = inspector.get_foreign_keys("questions")
+        if not any(key["constrained_columns"] == ["category"] for key in foreign_keys):
+            print("Adding the foreign key to categories")
+            connection.execute(
+                text(
+                    "ALTER TABLE questions ADD CONSTRAINT {} FOREIGN KEY (category) "
+                    "REFERENCES categories (id) "
+                    "ON UPDATE CASCADE ON DELETE SET NULL".format(FOREIGN_KEY_NAME)
+                )
+            )
+
+        indexes = inspector.get_indexes("questions")
+        if not any(index["name"] == INDEX_NAME for index in indexes):
+            print("Adding the (category, id) index")
+            connection.execute(
+                text("CREATE INDEX {} ON questions (category, id)".format(INDEX_NAME))
+            )
+
+    print("questions.category is an indexed integer foreign key")
+
+
+if __name__ == "__main__":
+    migrate(create_engine(sys.argv[1] if len(sys.argv) > 1 else database_path))
@@ -1,13 +1,21 @@
 import os
-from sqlalchemy import Column, String, Integer, create_engine
+from sqlalchemy import Column, String, Integer, ForeignKey, Index, create_engine, inspect
 from flask_sqlalchemy import SQLAlchemy
 import json
+import weakref
 
 database_name = "trivia"
 database_path = "postgres://{}/{}".format('localhost:5432', database_name)
 
 db = SQLAlchemy()
 
+# The text search document of a question, over its question and answer text.
+# Searches must use this exact expression for Postgres to use its GIN index.
+SEARCH_CONFIG = "'english'"
+SEARCH_DOCUMENT = (
+  "to_tsvector({}, coalesce(question, '') || ' ' || coalesce(answer, ''))"
+  .format(SEARCH_CONFIG))
+
 '''
 setup_db(app)
     binds a flask application and a SQLAlchemy service
@@ -18,6 +26,37 @@ def setup_db(app, database_path=database_path):
     db.app = app
     db.init_app(app)
     db.create_all()
+    create_search_index()
+
+'''
+create_search_index()
+    creates the GIN index full-text question search uses on Postgres
+    create_all() cannot create it, as the index is over an expression
+    other databases search with an in-memory index instead
+'''
+def create_search_index():
+    if db.engine.dialect.name != 'postgresql':
+        return
+    db.session.execute(
+        'CREATE INDEX IF NOT EXISTS ix_questions_search ON questions '
+        'USING GIN ({})'.format(SEARCH_DOCUMENT))
+    db.session.commit()
+
+'''
+question_listeners
+    callables notified with (action, question, previous_category) after
+    Question.insert(), update() or delete() commits, where action is one of
+    "insert", "update" or "delete"
+    listeners are held weakly, so caches of discarded apps are not kept alive
+'''
+question_listeners = weakref.WeakSet()
+
+def add_question_listener(listener):
+  question_listeners.add(listener)
+
+def notify_question_listeners(action, question, previous_category=None):
+  for listener in list(question_listeners):
+    listener(action, question, previous_category)
 
 '''
 Question
@@ -29,9 +68,15 @@ class Question(db.Model):
   id = Column(Integer, primary_key=True)
   question = Column(String)
   answer = Column(String)
-  category = Column(String)
+  category = Column(
+    Integer,
+    ForeignKey('categories.id', name='category', onupdate='CASCADE', ondelete='SET NULL'))
   difficulty = Column(Integer)
 
+  # Category pages filter by category and page through the questions by id.
+  # The index also serves the foreign key and the quiz's category filter.
+  __table_args__ = (Index('ix_questions_category_id', 'category', 'id'),)
+
   def __init__(self, question, answer, category, difficulty):
     self.question = question
     self.answer = answer
@@ -41,13 +86,19 @@ class Question(db.Model):
   def insert(self):
     db.session.add(self)
     db.session.commit()
+    notify_question_listeners('insert', self)
   
   def update(self):
+    history = inspect(self).attrs.category.history
+    previous_category = history.deleted[0] if history.deleted else self.category
     db.session.commit()
+    notify_question_listeners('update', self, previous_category)
 
   def delete(self):
+    category = self.category
     db.session.delete(self)
     db.session.commit()
+    notify_question_listeners('delete', self, category)
 
   def format(self):
     return {
@@ -1,10 +1,12 @@
 import os
 import unittest
 import json
+from unittest import mock
 from flask_sqlalchemy import SQLAlchemy
 
 from flaskr import create_app
-from models import setup_db, Question, Category
+from flaskr.quiz_sessions import MemoryQuizSessionStore, RedisQuizSessionStore
+from models import setup_db, db, Question, Category
 
 
 class TriviaTestCase(unittest.TestCase):
@@ -55,6 +57,19 @@ class TriviaTestCase(unittest.TestCase):
         self.assertIsNone(data["current_category"])
         self.assertTrue(len(data["categories"]))
 
+    def test_get_questions_after_id(self):
+        """ Test if questions can be paged through by the last id seen """
+        first_page = json.loads(self.client().get("/questions").data)
+        last_id = first_page["questions"][-1]["id"]
+
+        response = self.client().get("/questions?after_id={}".format(last_id))
+        data = json.loads(response.data)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(len(data["questions"]))
+        self.assertTrue(all(question["id"] > last_id for question in data["questions"]))
+        self.assertEqual(data["total_questions"], first_page["total_questions"])
+
     def test_404_sent_requesting_beyond_valid_page(self):
         """ Test if 404 error when the page is invalid """
         response = self.client().get("/questions?page=1000")
@@ -118,6 +133,148 @@ class TriviaTestCase(unittest.TestCase):
         self.assertIsNone(data["current_category"])
         self.assertTrue(len(data["categories"]))
 
+    def test_cached_counts_follow_inserts_and_deletes(self):
+        """ Test if cached question counts match the database after writes """
+
+        def totals():
+            all_questions = json.loads(self.client().get("/questions").data)
+            category = json.loads(self.client().get("/categories/3/questions").data)
+            return all_questions["total_questions"], category["total_questions"]
+
+        def counted():
+            with self.app.app_context():
+                category = Question.query.filter(Question.category == 3)
+                return Question.query.count(), category.count()
+
+        before = totals()
+        self.assertEqual(before, counted())
+
+        with self.app.app_context():
+            question = Question(**self.new_question)
+            question.insert()
+            self.assertEqual(totals(), (before[0] + 1, before[1] + 1))
+            self.assertEqual(totals(), counted())
+
+            question.delete()
+            self.assertEqual(totals(), before)
+            self.assertEqual(totals(), counted())
+
+    def test_caches_follow_writes_by_other_processes(self):
+        """ Test if ETags and cached counts follow writes that skip this process """
+        questions = Question.__table__
+
+        def write(statement):
+            # Core statements skip the question listeners, like another worker.
+            with self.app.app_context():
+                db.session.execute(statement)
+                db.session.commit()
+
+        first_page = self.client().get("/questions")
+        etag = first_page.headers["ETag"]
+        total = json.loads(first_page.data)["total_questions"]
+
+        write(questions.insert().values(**self.new_question))
+        response = self.client().get("/questions", headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.data)["total_questions"], total + 1)
+
+        write(
+            questions.delete().where(
+                questions.c.question == self.new_question["question"]
+            )
+        )
+        response = self.client().get("/questions")
+        self.assertEqual(json.loads(response.data)["total_questions"], total)
+
+    def test_bulk_import_and_export_questions(self):
+        """ Test if questions can be imported and exported as JSON lines """
+        before = json.loads(self.client().get("/questions").data)["total_questions"]
+        lines = [
+            json.dumps(dict(self.new_question, question="Bulk question {}".format(i)))
+            for i in range(3)
+        ]
+
+        response = self.client().post("/questions/bulk", data="\n".join(lines))
+        data = json.loads(response.data)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(data["created"], 3)
+        total = json.loads(self.client().get("/questions").data)["total_questions"]
+        self.assertEqual(total, before + 3)
+
+        response = self.client().get("/questions/export")
+        exported = [json.loads(line) for line in response.data.splitlines()]
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(exported), total)
+        self.assertIn("Bulk question 2", [row["question"] for row in exported])
+
+    def test_422_if_bulk_import_has_invalid_rows(self):
+        """ Test if a bulk import with invalid rows imports nothing """
+        before = json.loads(self.client().get("/questions").data)["total_questions"]
+        lines = [
+            json.dumps(self.new_question),
+            json.dumps(dict(self.new_question, category=1000)),
+            "not json",
+        ]
+
+        response = self.client().post("/questions/bulk", data="\n".join(lines))
+        data = json.loads(response.data)
+
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(data["success"], False)
+        self.assertEqual([error["line"] for error in data["errors"]], [2, 3])
+        total = json.loads(self.client().get("/questions").data)["total_questions"]
+        self.assertEqual(total, before)
+
+    def test_minimal_responses_to_writes(self):
+        """ Test if writes can skip the question list and return its new ETag """
+        etag = self.client().get("/questions").headers["ETag"]
+
+        response = self.client().post(
+            "/questions?return=minimal", json=self.new_question
+        )
+        data = json.loads(response.data)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(data), {"success", "created_id"})
+        self.assertNotEqual(response.headers["ETag"], etag)
+        etag = response.headers["ETag"]
+        self.assertEqual(self.client().get("/questions").headers["ETag"], etag)
+
+        response = self.client().delete(
+            "/questions/{}".format(data["created_id"]),
+            headers={"Prefer": "return=minimal"},
+        )
+        data = json.loads(response.data)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(data), {"success", "deleted_id"})
+        self.assertEqual(response.headers["Preference-Applied"], "return=minimal")
+        self.assertNotEqual(response.headers["ETag"], etag)
+
+    def test_conditional_get_of_question_lists(self):
+        """ Test if unchanged lists return 304 until a question changes """
+        for path in ["/categories", "/questions", "/categories/1/questions"]:
+            etag = self.client().get(path).headers["ETag"]
+            response = self.client().get(path, headers={"If-None-Match": etag})
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(response.data, b"")
+            self.assertEqual(response.headers["ETag"], etag)
+
+        first_page = self.client().get("/questions")
+        response = self.client().post("/questions", json=self.new_question)
+        created_id = json.loads(response.data)["created_id"]
+
+        response = self.client().get(
+            "/questions", headers={"If-None-Match": first_page.headers["ETag"]}
+        )
+        data = json.loads(response.data)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers["ETag"], first_page.headers["ETag"])
+        self.assertEqual(
+            data["total_questions"],
+            json.loads(first_page.data)["total_questions"] + 1,
+        )
+        self.client().delete("/questions/{}".format(created_id))
+
     def test_405_if_question_creation_not_allowed(self):
         """ Test if 405 error when method is invalid """
         response = self.client().post("/questions/45", json=self.new_question)
@@ -150,12 +307,33 @@ class TriviaTestCase(unittest.TestCase):
 
         data = json.loads(response.data)
 
+        # Search matches word prefixes, so "entitled" is no longer a hit.
         self.assertEqual(response.status_code, 200)
-        self.assertEqual(len(data["questions"]), 2)
+        self.assertEqual(len(data["questions"]), 1)
         self.assertTrue(data["total_questions"])
         self.assertIsNone(data["current_category"])
         self.assertTrue(len(data["categories"]))
 
+    def test_get_question_search_with_stop_words(self):
+        """ Test if a search for a stop word still finds questions """
+        response = self.client().post("/questions-search", json={"searchTerm": "the"})
+        data = json.loads(response.data)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(len(data["questions"]))
+        self.assertTrue(data["total_questions"])
+
+    def test_get_question_search_matches_answers_and_word_prefixes(self):
+        """ Test if search matches answer text and words starting with the term """
+        response = self.client().post(
+            "/questions-search", json={"searchTerm": "edward scissor"}
+        )
+        data = json.loads(response.data)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(data["total_questions"], 1)
+        self.assertEqual(data["questions"][0]["answer"], "Edward Scissorhands")
+
     def test_get_question_search_without_results(self):
         """ Test if nothing is returned when no questions match the search term """
         response = self.client().post(
@@ -195,6 +373,155 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertTrue(data["question"], True)
 
+    def test_get_quiz_questions_skips_previous_questions(self):
+        """ Test if the quiz only returns questions that were not played yet """
+        with self.app.app_context():
+            question_ids = [
+                question.id
+                for question in Question.query.filter(Question.category == 1)
+            ]
+
+        response = self.client().post(
+            "/quizzes",
+            json={"previous_questions": question_ids[1:], "quiz_category": {"id": 1}},
+        )
+        data = json.loads(response.data)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(data["question"]["id"], question_ids[0])
+
+        response = self.client().post(
+            "/quizzes",
+            json={"previous_questions": question_ids, "quiz_category": {"id": 1}},
+        )
+        data = json.loads(response.data)
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(data["question"])
+
+    def test_quiz_session_plays_each_question_once(self):
+        """ Test if a quiz session returns every question of the category once """
+        response = self.client().post(
+            "/quizzes/sessions", json={"quiz_category": {"id": 1}}
+        )
+        data = json.loads(response.data)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(data["success"], True)
+        session_url = "/quizzes/sessions/{}/next".format(data["session_id"])
+
+        played = []
+        for _ in range(data["total_questions"]):
+            question = json.loads(self.client().post(session_url).data)["question"]
+            self.assertEqual(question["category"], 1)
+            played.append(question["id"])
+
+        self.assertEqual(len(set(played)), data["total_questions"])
+        data = json.loads(self.client().post(session_url).data)
+        self.assertFalse(data["question"])
+
+    def test_404_if_quiz_session_does_not_exist(self):
+        """ Test if 404 error when the quiz session is unknown """
+        response = self.client().post("/quizzes/sessions/unknown/next")
+        data = json.loads(response.data)
+
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(data["success"], False)
+
+    def test_quiz_session_store_evicts_expired_and_least_recently_used(self):
+        """ Test if the session store stays within its size and TTL """
+        now = [0]
+        store = MemoryQuizSessionStore(max_sessions=2, ttl=10, clock=lambda: now[0])
+        first = store.create([1, 2])
+        second = store.create([3])
+        self.assertEqual(store.next_question_id(first), 1)
+
+        third = store.create([4])
+        with self.assertRaises(KeyError):
+            store.next_question_id(second)
+        self.assertEqual(len(store), 2)
+
+        now[0] = 5
+        self.assertEqual(store.next_question_id(first), 2)
+        now[0] = 12
+        self.assertIsNone(store.next_question_id(first))
+        with self.assertRaises(KeyError):
+            store.next_question_id(third)
+
+    def test_redis_quiz_session_store_plays_and_expires_sessions(self):
+        """ Test if the Redis session store plays questions in order and expires """
+        now = [0]
+        client = FakeRedis(clock=lambda: now[0])
+        store = RedisQuizSessionStore(client, ttl=10)
+        session_id = store.create([3, 1, 2])
+
+        self.assertEqual(store.next_question_id(session_id), 3)
+        now[0] = 8
+        self.assertEqual(store.next_question_id(session_id), 1)
+        now[0] = 16
+        self.assertEqual(store.next_question_id(session_id), 2)
+        self.assertIsNone(store.next_question_id(session_id))
+        with self.assertRaises(KeyError):
+            store.next_question_id("unknown")
+
+        now[0] = 40
+        with self.assertRaises(KeyError):
+            store.next_question_id(session_id)
+
+    def test_configured_quiz_session_store_is_used(self):
+        """ Test if a configured store serves quiz sessions instead of memory """
+        store = RedisQuizSessionStore(FakeRedis())
+        with mock.patch("flaskr.MemoryQuizSessionStore") as memory_store:
+            app = create_app({"QUIZ_SESSION_STORE": store})
+        memory_store.assert_not_called()
+        setup_db(app, self.database_path)
+
+        response = app.test_client().post(
+            "/quizzes/sessions", json={"quiz_category": {"id": 1}}
+        )
+        session_id = json.loads(response.data)["session_id"]
+        question = json.loads(
+            app.test_client().post(f"/quizzes/sessions/{session_id}/next").data
+        )["question"]
+        self.assertEqual(question["category"], 1)
+        self.assertTrue(store.client.exists(store.prefix + session_id))
+
+
+class FakeRedis:
+    """The Redis commands RedisQuizSessionStore uses, kept in a dict."""
+
+    def __init__(self, clock=lambda: 0):
+        self.clock = clock
+        self.values = {}
+        self.expires_at = {}
+
+    def _get(self, key, default=None):
+        if self.expires_at.get(key, float("inf")) <= self.clock():
+            self.values.pop(key, None)
+            self.expires_at.pop(key, None)
+        return self.values.get(key, default)
+
+    def rpush(self, key, *values):
+        items = self._get(key, [])
+        items.extend(str(value).encode() for value in values)
+        self.values[key] = items
+        return len(items)
+
+    def incr(self, key, amount=1):
+        self.values[key] = int(self._get(key, 0)) + amount
+        return self.values[key]
+
+    def lindex(self, key, index):
+        items = self._get(key, [])
+        return items[index] if 0 <= index < len(items) else None
+
+    def exists(self, key):
+        return int(self._get(key) is not None)
+
+    def expire(self, key, seconds):
+        if self._get(key) is None:
+            return False
+        self.expires_at[key] = self.clock() + seconds
+        return True
+
 
 # check if string is JSON
 def is_json(data):
@@ -0,0 +1,255 @@
+"""
+Benchmarks for the coffee shop backend.
+
+Usage:
+    python benchmark.py auth --repeat 20 --calls 1000
+    python benchmark.py drinks --drinks 10000
+
+Tokens are signed with a key generated for the run and verified against a
+stub key set, so no Auth0 tenant is needed. Drinks are seeded into a scratch
+SQLite database in the temp directory.
+"""
+import argparse
+import contextlib
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from flask import Flask
+from jose import jwk, jwt
+from sqlalchemy import text
+
+from src.api import app as api_app
+from src.auth import auth
+from src.auth.jwks import JWKSKeyStore
+from src.auth.token_cache import TokenCache
+from src.database.models import (
+    Drink,
+    DrinkIngredient,
+    db,
+    db_drop_and_create_all,
+    setup_db,
+)
+
+# ----------------------------------------------------------------------------#
+# Measurement
+# ----------------------------------------------------------------------------#
+
+
+def measure(label, fn, repeat, calls=1):
+    """Runs fn calls times, repeat times over, and prints its latency per call."""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(calls):
+            fn()
+        timings.append((time.perf_counter() - start) * 1000000 / calls)
+
+    print(
+        "{:<24} median={:9.2f}us best={:9.2f}us".format(
+            label, statistics.median(timings), min(timings)
+        )
+    )
+
+
+# ----------------------------------------------------------------------------#
+# Auth
+# ----------------------------------------------------------------------------#
+
+
+def generate_private_key():
+    """Returns a new RSA private key as PEM, with whichever backend is installed."""
+    try:
+        # pycryptodome, which requirements.txt installs for python-jose.
+        from Crypto.PublicKey import RSA
+
+        return RSA.generate(2048).exportKey().decode()
+    except ImportError:
+        # The pure Python backend python-jose falls back to.
+        import rsa
+
+        _, private_key = rsa.newkeys(2048)
+        return private_key.save_pkcs1().decode()
+
+
+def signed_token(private_key, kid, permissions):
+    claims = {
+        "iss": "https://" + auth.AUTH0_DOMAIN + "/",
+        "aud": auth.API_AUDIENCE,
+        "sub": "benchmark",
+        "exp": int(time.time()) + 3600,
+        "permissions": permissions,
+    }
+    return jwt.encode(claims, private_key, algorithm="RS256", headers={"kid": kid})
+
+
+def bench_auth(args):
+    """Times the requires_auth decorator with the token cache off and on."""
+    private_key = generate_private_key()
+    public_key = jwk.construct(private_key, "RS256").public_key().to_dict()
+    public_key.update({"kid": "benchmark", "use": "sig"})
+    auth.jwks = JWKSKeyStore(lambda: {"keys": [public_key]})
+
+    token = signed_token(private_key, "benchmark", ["get:drinks-detail"])
+    app = Flask(__name__)
+
+    @auth.requires_auth("get:drinks-detail")
+    def view(payload):
+        return payload
+
+    print("requires_auth('get:drinks-detail'), one token")
+    # Time the decorator alone, within a single request.
+    with app.test_request_context(headers={"Authorization": "Bearer " + token}):
+        for label, size in [("  cache off", 0), ("  cache on", auth.TOKEN_CACHE_SIZE)]:
+            auth.verified_tokens = TokenCache(size, auth.TOKEN_CACHE_MAX_AGE)
+            measure(label, view, args.repeat, args.calls)
+
+
+# ----------------------------------------------------------------------------#
+# Drinks
+# ----------------------------------------------------------------------------#
+
+INGREDIENTS = [
+    ("water", "blue"),
+    ("coffee", "brown"),
+    ("milk", "white"),
+    ("foam", "beige"),
+    ("chocolate", "#5c3317"),
+    ("caramel", "#af6f09"),
+]
+
+
+def seed_drinks(num_drinks):
+    rng = random.Random(0)
+    drinks = []
+    ingredients = []
+    for drink_id in range(1, num_drinks + 1):
+        recipe = [
+            {"name": name, "color": color, "parts": rng.randint(1, 4)}
+            for name, color in rng.sample(INGREDIENTS, rng.randint(1, 3))
+        ]
+        drinks.append(
+            {"id": drink_id, "title": "Drink {}".format(drink_id), "recipe": recipe}
+        )
+        ingredients.extend(
+            {"drink_id": drink_id, "name": ingredient["name"]} for ingredient in recipe
+        )
+    db.session.execute(Drink.__table__.insert(), drinks)
+    db.session.execute(DrinkIngredient.__table__.insert(), ingredients)
+    db.session.commit()
+
+
+def legacy_drinks():
+    """The drink rows, with each recipe as the JSON string it is stored as."""
+    return db.session.execute(text("SELECT id, title, recipe FROM drink ORDER BY id"))
+
+
+def legacy_short(drink):
+    """Drink.short() when recipes were decoded on every call."""
+    print(json.loads(drink.recipe))
+    short_recipe = [
+        {"color": r["color"], "parts": r["parts"]} for r in json.loads(drink.recipe)
+    ]
+    return {"id": drink.id, "title": drink.title, "recipe": short_recipe}
+
+
+def legacy_with_ingredient(name):
+    """Finds the drinks with an ingredient by decoding every recipe."""
+    return [
+        drink
+        for drink in legacy_drinks()
+        if any(ingredient["name"] == name for ingredient in json.loads(drink.recipe))
+    ]
+
+
+def bench_drinks(args):
+    """Times serializing and finding drinks, before and after the JSON column."""
+    database_path = os.path.join(tempfile.gettempdir(), "coffee_benchmark.db")
+    setup_db(api_app, "sqlite:///" + database_path)
+
+    @api_app.route("/legacy-drinks")
+    def get_legacy_drinks():
+        return {
+            "success": True,
+            "drinks": [legacy_short(drink) for drink in legacy_drinks()],
+        }
+
+    client = api_app.test_client()
+    with api_app.app_context(), open(os.devnull, "w") as devnull:
+        db_drop_and_create_all()
+        seed_drinks(args.drinks)
+        drinks = Drink.query.order_by(Drink.id).all()
+        rows = legacy_drinks().fetchall()
+
+        print("{} drinks".format(args.drinks))
+
+        # The legacy short() printed every recipe; time writing it, not a terminal.
+        def legacy(fn):
+            def run():
+                with contextlib.redirect_stdout(devnull):
+                    fn()
+
+            return run
+
+        measure(
+            "  short(), legacy",
+            legacy(lambda: [legacy_short(row) for row in rows]),
+            args.repeat,
+        )
+        measure(
+            "  GET /drinks, legacy",
+            legacy(lambda: client.get("/legacy-drinks").get_data()),
+            args.repeat,
+        )
+        measure(
+            "  short(), memoized",
+            lambda: [drink.short() for drink in drinks],
+            args.repeat,
+        )
+        measure(
+            "  serialize_all()",
+            lambda: Drink.serialize_all(drinks, "short"),
+            args.repeat,
+        )
+        measure(
+            "  GET /drinks",
+            lambda: client.get("/drinks").get_data(),
+            args.repeat,
+        )
+        measure(
+            "  with milk, decoding",
+            lambda: legacy_with_ingredient("milk"),
+            args.repeat,
+        )
+        measure(
+            "  with milk, indexed",
+            lambda: Drink.with_ingredient("milk").all(),
+            args.repeat,
+        )
+
+
+# ----------------------------------------------------------------------------#
+# Launch
+# ----------------------------------------------------------------------------#
+
+BENCHMARKS = {
+    "auth": bench_auth,
+    "drinks": bench_drinks,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("benchmark", choices=sorted(BENCHMARKS))
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--calls", type=int, default=1000)
+    parser.add_argument("--drinks", type=int, default=10000)
+    args = parser.parse_args()
+    BENCHMARKS[args.benchmark](args)
+
+
+if __name__ == "__main__":
+    main()
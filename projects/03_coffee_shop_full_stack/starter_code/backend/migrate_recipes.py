@@ -0,0 +1,94 @@
+"""
+Moves drink recipes to a native JSON column and indexes their ingredients.
+
+Databases created before Drink.recipe became a JSON column, like the
+database.db shipped with the starter code, store recipes as JSON strings in
+a VARCHAR(180) column. This script converts the column, on SQLite by
+rebuilding the drink table, creates the drink_ingredient lookup table and
+fills it from the recipes. It runs in one transaction and can safely be run
+again.
+
+Nothing is changed if a recipe is not valid JSON; those drinks are listed so
+they can be fixed first.
+
+Usage:
+    python migrate_recipes.py [database_path]
+"""
+import json
+import sys
+
+from sqlalchemy import JSON, create_engine, inspect, text
+
+from src.database.models import Drink, DrinkIngredient, database_path, ingredient_key
+
+
+def load_recipes(connection):
+    """Returns {drink id: ingredient names} and the (id, title) of invalid recipes."""
+    recipes = {}
+    invalid = []
+    rows = connection.execute(text("SELECT id, title, recipe FROM drink ORDER BY id"))
+    for drink_id, title, recipe in rows:
+        try:
+            recipe = json.loads(recipe) if isinstance(recipe, str) else recipe
+            names = [
+                ingredient["name"] for ingredient in recipe if "name" in ingredient
+            ]
+        except (TypeError, ValueError):
+            invalid.append((drink_id, title))
+            continue
+        recipes[drink_id] = names
+    return recipes, invalid
+
+
+def convert_recipe_column(connection):
+    if connection.dialect.name == "sqlite":
+        # SQLite cannot change a column type; JSON is stored as text in both.
+        connection.execute(text("ALTER TABLE drink RENAME TO drink_string_recipe"))
+        Drink.__table__.create(connection)
+        connection.execute(
+            text(
+                "INSERT INTO drink (id, title, recipe) "
+                "SELECT id, title, recipe FROM drink_string_recipe"
+            )
+        )
+        connection.execute(text("DROP TABLE drink_string_recipe"))
+    else:
+        connection.execute(
+            text("ALTER TABLE drink ALTER COLUMN recipe TYPE json USING recipe::json")
+        )
+
+
+def migrate(engine):
+    with engine.begin() as connection:
+        recipes, invalid = load_recipes(connection)
+        if invalid:
+            for drink_id, title in invalid:
+                print("Drink {} ({!r}) has an invalid recipe".format(drink_id, title))
+            raise SystemExit("No changes made; fix the recipes above first.")
+
+        columns = {
+            column["name"]: column
+            for column in inspect(connection).get_columns("drink")
+        }
+        if not isinstance(columns["recipe"]["type"], JSON):
+            print("Converting drink.recipe to JSON")
+            convert_recipe_column(connection)
+
+        print("Indexing the ingredients of {} drinks".format(len(recipes)))
+        ingredients = DrinkIngredient.__table__
+        # Recreated rather than emptied, so its columns match the model.
+        ingredients.drop(connection, checkfirst=True)
+        ingredients.create(connection)
+        rows = [
+            {"drink_id": drink_id, "name": name}
+            for drink_id, names in recipes.items()
+            for name in dict.fromkeys(ingredient_key(name) for name in names)
+        ]
+        if rows:
+            connection.execute(ingredients.insert(), rows)
+
+    print("drink.recipe is a JSON column with indexed ingredients")
+
+
+if __name__ == "__main__":
+    migrate(create_engine(sys.argv[1] if len(sys.argv) > 1 else database_path))
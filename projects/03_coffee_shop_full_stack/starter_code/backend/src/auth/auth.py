@@ -1,14 +1,33 @@
-import json
-from flask import request, _request_ctx_stack
+from flask import request
 from functools import wraps
 from jose import jwt
-from urllib.request import urlopen
+
+from .jwks import JWKSError, JWKSKeyStore, url_source
+from .permissions import compile_permissions, frozen_permissions
+from .token_cache import TokenCache
 
 
 AUTH0_DOMAIN = 'udacity-fsnd.auth0.com'
 ALGORITHMS = ['RS256']
 API_AUDIENCE = 'dev'
 
+'''
+jwks
+    the Auth0 signing keys by kid, fetched once and refreshed in the background
+    !!NOTE point it at a file_source() or a stub to run without Auth0
+'''
+jwks = JWKSKeyStore(url_source(f'https://{AUTH0_DOMAIN}/.well-known/jwks.json'))
+
+'''
+verified_tokens
+    the payloads of verified tokens, so each token is only verified once
+    entries expire at the token's exp or after TOKEN_CACHE_MAX_AGE seconds
+    !!NOTE a TOKEN_CACHE_SIZE of 0 verifies every token on every request
+'''
+TOKEN_CACHE_SIZE = 1024
+TOKEN_CACHE_MAX_AGE = 300
+verified_tokens = TokenCache(TOKEN_CACHE_SIZE, TOKEN_CACHE_MAX_AGE)
+
 ## AuthError Exception
 '''
 AuthError Exception
@@ -23,64 +42,161 @@ class AuthError(Exception):
 ## Auth Header
 
 '''
-@TODO implement get_token_auth_header() method
-    it should attempt to get the header from the request
-        it should raise an AuthError if no header is present
-    it should attempt to split bearer and the token
-        it should raise an AuthError if the header is malformed
-    return the token part of the header
+get_token_auth_header()
+    returns the token of the request's 'Authorization: Bearer <token>' header
+    raises a 401 AuthError if the header is missing or malformed
 '''
 def get_token_auth_header():
-   raise Exception('Not Implemented')
+    auth = request.headers.get('Authorization', None)
+    if not auth:
+        raise AuthError({
+            'code': 'authorization_header_missing',
+            'description': 'Authorization header is expected.'
+        }, 401)
+
+    parts = auth.split()
+    if parts[0].lower() != 'bearer':
+        raise AuthError({
+            'code': 'invalid_header',
+            'description': 'Authorization header must start with "Bearer".'
+        }, 401)
+
+    elif len(parts) == 1:
+        raise AuthError({
+            'code': 'invalid_header',
+            'description': 'Token not found.'
+        }, 401)
+
+    elif len(parts) > 2:
+        raise AuthError({
+            'code': 'invalid_header',
+            'description': 'Authorization header must be bearer token.'
+        }, 401)
+
+    return parts[1]
 
 '''
-@TODO implement check_permissions(permission, payload) method
+check_permissions(permission, payload, permissions=None)
     @INPUTS
         permission: string permission (i.e. 'post:drink')
+            or a permission expression (i.e. 'patch:drinks & get:drinks-detail'),
+            compiled or not, see permissions.py
         payload: decoded jwt payload
+        permissions: the payload permissions frozen into a set, if already known
 
-    it should raise an AuthError if permissions are not included in the payload
+    raises a 400 AuthError if permissions are not included in the payload
         !!NOTE check your RBAC settings in Auth0
-    it should raise an AuthError if the requested permission string is not in the payload permissions array
-    return true otherwise
+    raises a 403 AuthError if the payload permissions do not satisfy permission
+    returns True otherwise
 '''
-def check_permissions(permission, payload):
-    raise Exception('Not Implemented')
+def check_permissions(permission, payload, permissions=None):
+    if permissions is None:
+        permissions = frozen_permissions(payload)
+    if permissions is None:
+        raise AuthError({
+            'code': 'invalid_claims',
+            'description': 'Permissions not included in JWT.'
+        }, 400)
+
+    if not compile_permissions(permission).matches(permissions):
+        raise AuthError({
+            'code': 'unauthorized',
+            'description': 'Permission not found.'
+        }, 403)
+
+    return True
 
 '''
-@TODO implement verify_decode_jwt(token) method
+verify_decode_jwt(token)
     @INPUTS
         token: a json web token (string)
 
-    it should be an Auth0 token with key id (kid)
-    it should verify the token using Auth0 /.well-known/jwks.json
-    it should decode the payload from the token
-    it should validate the claims
-    return the decoded payload
+    verifies the token's signature with the Auth0 key named by its key id (kid)
+        the keys are cached by the jwks key store, not fetched per request
+    validates its expiry, audience and issuer
+    returns the decoded payload
 
-    !!NOTE urlopen has a common certificate error described here: https://stackoverflow.com/questions/50236117/scraping-ssl-certificate-verify-failed-error-for-http-en-wikipedia-org
+    raises a 401 AuthError if the token has no kid, is expired or has the wrong claims
+    raises a 400 AuthError if its key is unknown or the token cannot be parsed
+    raises a 503 AuthError if the signing keys could never be fetched
 '''
 def verify_decode_jwt(token):
-    raise Exception('Not Implemented')
+    unverified_header = jwt.get_unverified_header(token)
+    if 'kid' not in unverified_header:
+        raise AuthError({
+            'code': 'invalid_header',
+            'description': 'Authorization malformed.'
+        }, 401)
+
+    try:
+        rsa_key = jwks.get_key(unverified_header['kid'])
+    except JWKSError:
+        raise AuthError({
+            'code': 'jwks_unavailable',
+            'description': 'Unable to fetch the signing keys.'
+        }, 503)
+
+    if not rsa_key:
+        raise AuthError({
+            'code': 'invalid_header',
+            'description': 'Unable to find the appropriate key.'
+        }, 400)
+
+    try:
+        return jwt.decode(
+            token,
+            rsa_key,
+            algorithms=ALGORITHMS,
+            audience=API_AUDIENCE,
+            issuer='https://' + AUTH0_DOMAIN + '/'
+        )
+
+    except jwt.ExpiredSignatureError:
+        raise AuthError({
+            'code': 'token_expired',
+            'description': 'Token expired.'
+        }, 401)
+
+    except jwt.JWTClaimsError:
+        raise AuthError({
+            'code': 'invalid_claims',
+            'description': 'Incorrect claims. Please, check the audience and issuer.'
+        }, 401)
+
+    except Exception:
+        raise AuthError({
+            'code': 'invalid_header',
+            'description': 'Unable to parse authentication token.'
+        }, 400)
 
 '''
-@TODO implement @requires_auth(permission) decorator method
+@requires_auth(permission)
     @INPUTS
         permission: string permission (i.e. 'post:drink')
+            or a permission expression, compiled once when the route is decorated
 
-    it should use the get_token_auth_header method to get the token
-    it should use the verify_decode_jwt method to decode the jwt
-    it should use the check_permissions method validate claims and check the requested permission
-    return the decorator which passes the decoded payload to the decorated method
+    gets the request's token with get_token_auth_header
+    decodes it with verify_decode_jwt
+        unless the token was verified before and its payload is still cached
+        the payload permissions are frozen into a set once per token
+    checks the requested permission with check_permissions
+    passes the decoded payload to the decorated method
 '''
 def requires_auth(permission=''):
+    required = compile_permissions(permission)
+
     def requires_auth_decorator(f):
         @wraps(f)
         def wrapper(*args, **kwargs):
             token = get_token_auth_header()
-            payload = verify_decode_jwt(token)
-            check_permissions(permission, payload)
+            verified = verified_tokens.get(token)
+            if verified is None:
+                payload = verify_decode_jwt(token)
+                verified = (payload, frozen_permissions(payload))
+                verified_tokens.set(token, payload, verified)
+            payload, permissions = verified
+            check_permissions(required, payload, permissions)
             return f(payload, *args, **kwargs)
 
         return wrapper
-    return requires_auth_decorator
\ No newline at end of file
+    return requires_auth_decorator
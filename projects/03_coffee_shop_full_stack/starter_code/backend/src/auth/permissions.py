@@ -0,0 +1,78 @@
+"""
+Permission expressions for requires_auth, compiled once at decoration time.
+
+An expression is a string of permissions joined by & (all of) and | (any
+of), with & binding tighter, so 'patch:drinks & get:drinks-detail |
+delete:drinks' requires patch:drinks and get:drinks-detail, or delete:drinks.
+An empty expression requires no permission. all_of() and any_of() build the
+same expressions from lists of permissions.
+
+Compiled expressions are any-of lists of frozensets of required permissions,
+checked against the token's permissions frozen into a set, so each check
+costs a set lookup per required permission, whatever the number of
+permissions the token carries.
+"""
+
+
+class PermissionExpression:
+    """Requires every permission of at least one of its groups."""
+
+    def __init__(self, groups):
+        self.groups = tuple(frozenset(group) for group in groups)
+
+    def __repr__(self):
+        return 'PermissionExpression({!r})'.format(str(self))
+
+    def __str__(self):
+        return ' | '.join(
+            ' & '.join(sorted(group)) for group in self.groups)
+
+    def __eq__(self, other):
+        return (isinstance(other, PermissionExpression)
+                and set(self.groups) == set(other.groups))
+
+    def __hash__(self):
+        return hash(frozenset(self.groups))
+
+    def matches(self, permissions):
+        """Returns whether a frozen set of granted permissions satisfies it."""
+        return any(group <= permissions for group in self.groups)
+
+
+def compile_permissions(expression):
+    """Returns the PermissionExpression for an expression string, or the
+    expression itself if it is already compiled.
+
+    Raises ValueError if the expression is malformed.
+    """
+    if isinstance(expression, PermissionExpression):
+        return expression
+    if not expression.strip():
+        return PermissionExpression([()])
+
+    groups = []
+    for alternative in expression.split('|'):
+        group = [permission.strip() for permission in alternative.split('&')]
+        for permission in group:
+            if not permission or len(permission.split()) != 1:
+                raise ValueError(
+                    'Invalid permission expression {!r}'.format(expression))
+        groups.append(group)
+    return PermissionExpression(groups)
+
+
+def all_of(*permissions):
+    return PermissionExpression([permissions])
+
+
+def any_of(*permissions):
+    return PermissionExpression([permission] for permission in permissions)
+
+
+def frozen_permissions(payload):
+    """Returns the permissions a token payload grants as a frozenset, or None
+    if it has no permissions claim.
+    """
+    if 'permissions' not in payload:
+        return None
+    return frozenset(payload['permissions'])
@@ -0,0 +1,82 @@
+"""
+A cache of the payloads of tokens that passed verification.
+
+A client sends the same bearer token on every request until it expires, so
+its RS256 signature only needs to be verified once. TokenCache keeps the
+verified payloads by a SHA-256 hash of the token, so the cache does not hold
+usable credentials, and drops each one at the earlier of the token's exp and
+max_age seconds after it was verified. Once max_size payloads are cached,
+the least recently used is evicted.
+
+This is the canonical copy of the module, tested in test_auth.py.
+BasicFlaskAuth/token_cache.py is a vendored copy: make changes here and copy
+them there.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+
+class TokenCache:
+    """Maps verified tokens to their payloads; a max_size of 0 disables it."""
+
+    def __init__(self, max_size=1024, max_age=300, clock=time.time):
+        self.max_size = max_size
+        self.max_age = max_age
+        self._clock = clock
+        self._lock = threading.Lock()
+        # Token hash -> (expires at, payload), least recently used first.
+        self._payloads = OrderedDict()
+
+    def __len__(self):
+        return len(self._payloads)
+
+    def get(self, token):
+        """Returns the payload of a verified token, or None if it is not cached
+        or expired.
+        """
+        if not self.max_size:
+            return None
+        key = token_hash(token)
+        with self._lock:
+            entry = self._payloads.get(key)
+            if entry is None:
+                return None
+            expires_at, payload = entry
+            if expires_at <= self._clock():
+                del self._payloads[key]
+                return None
+            self._payloads.move_to_end(key)
+            return payload
+
+    def set(self, token, payload, value=None):
+        """Caches the payload of a token that passed verification, or value in
+        its place, until the payload's exp at the latest.
+        """
+        if not self.max_size:
+            return
+        now = self._clock()
+        expires_at = now + self.max_age
+        if 'exp' in payload:
+            expires_at = min(expires_at, payload['exp'])
+        if expires_at <= now:
+            return
+
+        key = token_hash(token)
+        with self._lock:
+            self._payloads[key] = (
+                expires_at, payload if value is None else value)
+            self._payloads.move_to_end(key)
+            while len(self._payloads) > self.max_size:
+                self._payloads.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._payloads.clear()
+
+
+def token_hash(token):
+    if isinstance(token, str):
+        token = token.encode()
+    return hashlib.sha256(token).digest()
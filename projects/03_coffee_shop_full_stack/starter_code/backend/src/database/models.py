@@ -1,5 +1,6 @@
 import os
-from sqlalchemy import Column, String, Integer
+from sqlalchemy import Column, String, Integer, ForeignKey
+from sqlalchemy.orm import validates
 from flask_sqlalchemy import SQLAlchemy
 import json
 
@@ -13,7 +14,7 @@ db = SQLAlchemy()
 setup_db(app)
     binds a flask application and a SQLAlchemy service
 '''
-def setup_db(app):
+def setup_db(app, database_path=database_path):
     app.config["SQLALCHEMY_DATABASE_URI"] = database_path
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
     db.app = app
@@ -29,6 +30,24 @@ def db_drop_and_create_all():
     db.drop_all()
     db.create_all()
 
+'''
+ingredient_key(name)
+    the name an ingredient is indexed by, so lookups ignore case and spacing
+'''
+def ingredient_key(name):
+    return ' '.join(str(name).split()).lower()
+
+'''
+DrinkIngredient
+an ingredient of a drink recipe, kept in sync with Drink.recipe
+indexed by name, to find the drinks containing an ingredient without decoding every recipe
+'''
+class DrinkIngredient(db.Model):
+    __tablename__ = 'drink_ingredient'
+    drink_id = Column(Integer, ForeignKey('drink.id', ondelete='CASCADE'), primary_key=True)
+    # the ingredient_key() of the ingredient name, as long as the recipe has it
+    name = Column(String, primary_key=True, index=True)
+
 '''
 Drink
 a persistent drink entity, extends the base SQLAlchemy Model
@@ -38,21 +57,48 @@ class Drink(db.Model):
     id = Column(Integer().with_variant(Integer, "sqlite"), primary_key=True)
     # String Title
     title = Column(String(80), unique=True)
-    # the ingredients blob - this stores a lazy json blob
+    # the ingredients, stored in a native JSON column
     # the required datatype is [{'color': string, 'name':string, 'parts':number}]
-    recipe =  Column(String(180), nullable=False)
+    # a JSON string can be assigned too, it is decoded once when assigned
+    # !!NOTE assign a new list to change it, changes made in place are not saved
+    recipe = Column(db.JSON, nullable=False)
+    ingredients = db.relationship('DrinkIngredient', cascade='all, delete-orphan')
+
+    # (recipe, short recipe) of the last recipe projected
+    _short = None
+
+    @validates('recipe')
+    def validate_recipe(self, key, recipe):
+        if isinstance(recipe, str):
+            recipe = json.loads(recipe)
+
+        existing = {ingredient.name: ingredient for ingredient in self.ingredients}
+        names = dict.fromkeys(ingredient_key(r['name']) for r in recipe if 'name' in r)
+        self.ingredients = [existing.get(name) or DrinkIngredient(name=name) for name in names]
+        return recipe
+
+    '''
+    short_recipe()
+        the color and parts of each ingredient of the recipe
+        projected once per recipe: assigning recipe, or reloading it from the
+        database, projects it again
+        !!NOTE the returned list is shared, do not modify it
+    '''
+    def short_recipe(self):
+        recipe = self.recipe
+        if self._short is None or self._short[0] is not recipe:
+            self._short = (recipe, [{'color': r['color'], 'parts': r['parts']} for r in recipe])
+        return self._short[1]
 
     '''
     short()
         short form representation of the Drink model
     '''
     def short(self):
-        print(json.loads(self.recipe))
-        short_recipe = [{'color': r['color'], 'parts': r['parts']} for r in json.loads(self.recipe)]
         return {
             'id': self.id,
             'title': self.title,
-            'recipe': short_recipe
+            'recipe': self.short_recipe()
         }
 
     '''
@@ -63,9 +109,31 @@ class Drink(db.Model):
         return {
             'id': self.id,
             'title': self.title,
-            'recipe': json.loads(self.recipe)
+            'recipe': self.recipe
         }
 
+    '''
+    serialize_all(drinks, form)
+        short or long form representations of a list of drinks
+        EXAMPLE
+            Drink.serialize_all(Drink.query.all(), 'short')
+    '''
+    @staticmethod
+    def serialize_all(drinks, form='short'):
+        serialize = Drink.short if form == 'short' else Drink.long
+        return [serialize(drink) for drink in drinks]
+
+    '''
+    with_ingredient(name)
+        a query of the drinks containing an ingredient, answered by the drink_ingredient index
+        EXAMPLE
+            Drink.with_ingredient('milk').order_by(Drink.id).all()
+    '''
+    @staticmethod
+    def with_ingredient(name):
+        return Drink.query.join(Drink.ingredients).filter(
+            DrinkIngredient.name == ingredient_key(name))
+
     '''
     insert()
         inserts a new model into a database
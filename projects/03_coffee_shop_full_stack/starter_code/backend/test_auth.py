@@ -0,0 +1,306 @@
+import threading
+import time
+import unittest
+from unittest import mock
+
+from flask import Flask
+
+from src.auth import auth
+from src.auth.auth import AuthError, check_permissions, requires_auth
+from src.auth.jwks import JWKSError, JWKSKeyStore
+from src.auth.permissions import all_of, any_of, compile_permissions
+from src.auth.token_cache import TokenCache
+
+
+class PermissionsTestCase(unittest.TestCase):
+    """This class represents the permission expression test case"""
+
+    def assertMatches(self, expression, permissions, expected=True):
+        compiled = compile_permissions(expression)
+        self.assertEqual(compiled.matches(frozenset(permissions)), expected)
+
+    def test_single_permission(self):
+        """ Test if a permission only matches tokens granting it """
+        self.assertMatches("post:drinks", ["get:drinks-detail", "post:drinks"])
+        self.assertMatches("post:drinks", ["get:drinks-detail"], False)
+        self.assertMatches("post:drinks", [], False)
+
+    def test_all_of(self):
+        """ Test if & requires every permission """
+        expression = "patch:drinks & get:drinks-detail"
+        self.assertMatches(expression, ["get:drinks-detail", "patch:drinks"])
+        self.assertMatches(expression, ["patch:drinks"], False)
+        self.assertEqual(
+            compile_permissions(expression),
+            all_of("get:drinks-detail", "patch:drinks"),
+        )
+
+    def test_any_of(self):
+        """ Test if | requires one of the permissions """
+        expression = "patch:drinks | delete:drinks"
+        self.assertMatches(expression, ["delete:drinks"])
+        self.assertMatches(expression, ["patch:drinks"])
+        self.assertMatches(expression, ["get:drinks-detail"], False)
+        self.assertEqual(
+            compile_permissions(expression), any_of("delete:drinks", "patch:drinks")
+        )
+
+    def test_all_of_binds_tighter_than_any_of(self):
+        """ Test if a | b & c requires a, or both b and c """
+        expression = "delete:drinks | patch:drinks & get:drinks-detail"
+        self.assertMatches(expression, ["delete:drinks"])
+        self.assertMatches(expression, ["patch:drinks", "get:drinks-detail"])
+        self.assertMatches(expression, ["patch:drinks"], False)
+
+    def test_empty_expression(self):
+        """ Test if an empty expression requires no permission """
+        self.assertMatches("", [])
+        self.assertMatches(all_of(), ["post:drinks"])
+
+    def test_malformed_expression_fails_at_decoration(self):
+        """ Test if malformed expressions are rejected when decorating """
+        for expression in ["post:drinks &", "| post:drinks", "post drinks"]:
+            with self.assertRaises(ValueError):
+                requires_auth(expression)
+
+
+class RequiresAuthTestCase(unittest.TestCase):
+    """This class represents the requires_auth test case"""
+
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.payload = {
+            "sub": "barista",
+            "permissions": ["get:drinks-detail", "patch:drinks"],
+        }
+        self.verify = mock.patch.object(
+            auth, "verify_decode_jwt", return_value=self.payload
+        ).start()
+        mock.patch.object(auth, "verified_tokens", TokenCache()).start()
+
+    def tearDown(self):
+        mock.patch.stopall()
+
+    def call(self, permission, token="token"):
+        @requires_auth(permission)
+        def view(payload):
+            return payload
+
+        headers = {"Authorization": "Bearer " + token}
+        with self.app.test_request_context(headers=headers):
+            return view()
+
+    def test_token_verified_once(self):
+        """ Test if a token is verified once and then checked from the cache """
+        self.assertEqual(self.call("get:drinks-detail"), self.payload)
+        self.assertEqual(self.call("patch:drinks & get:drinks-detail"), self.payload)
+        self.assertEqual(self.verify.call_count, 1)
+
+        self.call("get:drinks-detail", token="other")
+        self.assertEqual(self.verify.call_count, 2)
+
+    def test_403_if_permission_missing(self):
+        """ Test if a missing permission raises a 403 AuthError """
+        with self.assertRaises(AuthError) as context:
+            self.call("delete:drinks | post:drinks")
+        self.assertEqual(context.exception.status_code, 403)
+
+    def test_400_if_permissions_not_in_payload(self):
+        """ Test if a payload without permissions raises a 400 AuthError """
+        with self.assertRaises(AuthError) as context:
+            check_permissions("get:drinks-detail", {"sub": "barista"})
+        self.assertEqual(context.exception.status_code, 400)
+
+
+class TokenCacheTestCase(unittest.TestCase):
+    """This class represents the verified token cache test case"""
+
+    def setUp(self):
+        self.now = 1000
+
+    def cache(self, max_size=1024, max_age=300):
+        return TokenCache(max_size, max_age, clock=lambda: self.now)
+
+    def test_payload_expires_at_exp(self):
+        """ Test if a payload is dropped at its token's exp """
+        cache = self.cache(max_age=300)
+        cache.set("token", {"sub": "barista", "exp": 1100})
+
+        self.now = 1099
+        self.assertEqual(cache.get("token"), {"sub": "barista", "exp": 1100})
+        self.now = 1100
+        self.assertIsNone(cache.get("token"))
+        self.assertEqual(len(cache), 0)
+
+    def test_payload_expires_after_max_age(self):
+        """ Test if a payload is dropped max_age seconds after it was verified """
+        cache = self.cache(max_age=300)
+        cache.set("token", {"sub": "barista", "exp": 5000})
+
+        self.now = 1299
+        self.assertIsNotNone(cache.get("token"))
+        self.now = 1300
+        self.assertIsNone(cache.get("token"))
+
+    def test_expired_payload_not_cached(self):
+        """ Test if a payload whose token already expired is not cached """
+        cache = self.cache()
+        cache.set("token", {"sub": "barista", "exp": 1000})
+        self.assertEqual(len(cache), 0)
+
+    def test_least_recently_used_evicted_at_max_size(self):
+        """ Test if the least recently used payload is evicted beyond max_size """
+        cache = self.cache(max_size=2)
+        cache.set("first", {"sub": "first"})
+        cache.set("second", {"sub": "second"})
+        cache.get("first")
+
+        cache.set("third", {"sub": "third"})
+        self.assertEqual(len(cache), 2)
+        self.assertIsNone(cache.get("second"))
+        self.assertEqual(cache.get("first"), {"sub": "first"})
+        self.assertEqual(cache.get("third"), {"sub": "third"})
+
+    def test_max_size_zero_disables_cache(self):
+        """ Test if a max_size of 0 caches nothing """
+        cache = self.cache(max_size=0)
+        cache.set("token", {"sub": "barista"})
+        self.assertIsNone(cache.get("token"))
+        self.assertEqual(len(cache), 0)
+
+    def test_value_cached_in_place_of_payload(self):
+        """ Test if a value can be cached in place of the payload """
+        cache = self.cache()
+        cache.set("token", {"sub": "barista", "exp": 1100}, ("payload", "permissions"))
+        self.assertEqual(cache.get("token"), ("payload", "permissions"))
+        self.now = 1100
+        self.assertIsNone(cache.get("token"))
+
+
+class StubSource:
+    """A key set source returning, or raising, the given results in turn."""
+
+    def __init__(self, *results):
+        self.results = list(results)
+        self.calls = 0
+        self.release = threading.Event()
+        self.release.set()
+
+    def __call__(self):
+        self.release.wait(5)
+        result = self.results[min(self.calls, len(self.results) - 1)]
+        self.calls += 1
+        if isinstance(result, Exception):
+            raise result
+        return {"keys": [{"kid": kid, "kty": "RSA"} for kid in result]}
+
+
+class JWKSKeyStoreTestCase(unittest.TestCase):
+    """This class represents the JWKS key store test case"""
+
+    def setUp(self):
+        self.now = 0
+
+    def store(self, source, **kwargs):
+        return JWKSKeyStore(source, clock=lambda: self.now, **kwargs)
+
+    def test_keys_cached_until_ttl(self):
+        """ Test if keys are fetched once and fetched again after the ttl """
+        source = StubSource(["first"], ["second"])
+        store = self.store(source, ttl=100, refresh_after=100)
+
+        self.assertEqual(store.get_key("first")["kid"], "first")
+        self.now = 99
+        self.assertEqual(store.get_key("first")["kid"], "first")
+        self.assertEqual(source.calls, 1)
+
+        self.now = 100
+        self.assertIsNone(store.get_key("first"))
+        self.assertEqual(store.get_key("second")["kid"], "second")
+        self.assertEqual(source.calls, 2)
+
+    def test_keys_refreshed_in_background(self):
+        """ Test if old keys are served while newer ones are fetched """
+        source = StubSource(["first"], ["first", "second"])
+        store = self.store(source, ttl=100, refresh_after=50)
+        store.get_key("first")
+
+        self.now = 60
+        source.release.clear()
+        self.assertEqual(store.get_key("first")["kid"], "first")
+        source.release.set()
+
+        # Unknown kids are not refetched while the refresh was just attempted.
+        deadline = time.monotonic() + 5
+        while store.get_key("second") is None and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(store.get_key("second")["kid"], "second")
+        self.assertEqual(source.calls, 2)
+
+    def test_unknown_kid_refetches_at_most_once_per_interval(self):
+        """ Test if unknown kids trigger a rate limited refetch """
+        source = StubSource(["first"], ["first", "rotated"])
+        store = self.store(source, ttl=3600, min_refetch_interval=30)
+
+        self.assertIsNone(store.get_key("rotated"))
+        self.now = 29
+        self.assertIsNone(store.get_key("rotated"))
+        self.assertEqual(source.calls, 1)
+
+        self.now = 30
+        self.assertEqual(store.get_key("rotated")["kid"], "rotated")
+        self.now = 45
+        self.assertIsNone(store.get_key("unknown"))
+        self.assertEqual(source.calls, 2)
+
+    def test_stale_keys_served_when_fetch_fails(self):
+        """ Test if the last keys fetched are served while the source fails """
+        source = StubSource(["first"], OSError("provider down"))
+        store = self.store(source, ttl=100, min_refetch_interval=30)
+        store.get_key("first")
+
+        self.now = 150
+        with self.assertLogs("src.auth.jwks", "ERROR"):
+            self.assertEqual(store.get_key("first")["kid"], "first")
+            self.assertFalse(store.refresh())
+        self.assertEqual(store.get_key("first")["kid"], "first")
+        self.assertEqual(source.calls, 3)
+
+    def test_error_if_keys_never_fetched(self):
+        """ Test if JWKSError is raised when no keys could be fetched """
+        store = self.store(StubSource(OSError("provider down")))
+        with self.assertLogs("src.auth.jwks", "ERROR"):
+            with self.assertRaises(JWKSError):
+                store.get_key("first")
+
+    def test_keys_read_while_first_fetch_completes(self):
+        """ Test if get_key works while another request finishes the first fetch """
+        source = StubSource(["first"])
+        results = []
+
+        def read_key():
+            try:
+                results.append(store.get_key("first")["kid"])
+            except Exception as e:
+                results.append(e)
+
+        def clock():
+            # The fetch reads the clock once the key set is in; have another
+            # request read the keys at that moment.
+            if source.calls == 1 and not readers:
+                readers.append(threading.Thread(target=read_key))
+                readers[0].start()
+                readers[0].join(0.2)
+            return 0
+
+        readers = []
+        store = JWKSKeyStore(source, clock=clock)
+        self.assertEqual(store.get_key("first")["kid"], "first")
+        readers[0].join(5)
+        self.assertEqual(results, ["first"])
+        self.assertEqual(source.calls, 1)
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()
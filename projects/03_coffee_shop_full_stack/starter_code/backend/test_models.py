@@ -0,0 +1,238 @@
+import contextlib
+import io
+import json
+import os
+import tempfile
+import unittest
+
+from flask import Flask
+from sqlalchemy import JSON, create_engine, inspect, text
+
+from migrate_recipes import migrate
+from src.database.models import (
+    Drink,
+    DrinkIngredient,
+    db,
+    db_drop_and_create_all,
+    setup_db,
+)
+
+
+class DrinkTestCase(unittest.TestCase):
+    """This class represents the Drink model test case"""
+
+    def setUp(self):
+        """Define test variables and create a fresh database."""
+        self.app = Flask(__name__)
+        setup_db(self.app, "sqlite://")
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db_drop_and_create_all()
+
+        self.latte = Drink(
+            title="Latte",
+            recipe=[
+                {"name": "coffee", "color": "brown", "parts": 1},
+                {"name": "milk", "color": "white", "parts": 3},
+            ],
+        )
+        self.water = Drink(
+            title="Water", recipe=[{"name": "water", "color": "blue", "parts": 1}]
+        )
+        db.session.add_all([self.latte, self.water])
+        db.session.commit()
+
+    def tearDown(self):
+        """Executed after each test"""
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_short_recipe_memoized_until_recipe_replaced(self):
+        """ Test if the short recipe is projected once per assigned recipe """
+        short_recipe = self.latte.short_recipe()
+        self.assertIs(self.latte.short_recipe(), short_recipe)
+        self.assertEqual(
+            short_recipe,
+            [{"color": "brown", "parts": 1}, {"color": "white", "parts": 3}],
+        )
+
+        self.latte.recipe = [{"name": "coffee", "color": "black", "parts": 2}]
+        self.assertEqual(self.latte.short_recipe(), [{"color": "black", "parts": 2}])
+
+        self.latte.recipe = '[{"name": "milk", "color": "white", "parts": 1}]'
+        self.assertEqual(self.latte.short_recipe(), [{"color": "white", "parts": 1}])
+
+    def test_short_recipe_projected_again_after_reload(self):
+        """ Test if a recipe reloaded from the database is projected again """
+        short_recipe = self.latte.short_recipe()
+        db.session.execute(
+            Drink.__table__.update()
+            .where(Drink.id == self.latte.id)
+            .values(recipe=[{"name": "tea", "color": "green", "parts": 1}])
+        )
+        db.session.commit()
+
+        self.assertIsNot(self.latte.short_recipe(), short_recipe)
+        self.assertEqual(self.latte.short_recipe(), [{"color": "green", "parts": 1}])
+
+    def test_serialize_all_matches_short_and_long(self):
+        """ Test if serialize_all gives each drink's short() or long() form """
+        drinks = Drink.query.order_by(Drink.id).all()
+
+        self.assertEqual(
+            Drink.serialize_all(drinks, "short"), [drink.short() for drink in drinks]
+        )
+        self.assertEqual(
+            Drink.serialize_all(drinks, "long"), [drink.long() for drink in drinks]
+        )
+        self.assertEqual(Drink.serialize_all([]), [])
+
+    def ingredient_names(self, drink):
+        rows = DrinkIngredient.query.filter_by(drink_id=drink.id)
+        return sorted(ingredient.name for ingredient in rows)
+
+    def test_ingredients_synced_when_recipe_replaced(self):
+        """ Test if the ingredient index follows every assigned recipe """
+        self.assertEqual(self.ingredient_names(self.latte), ["coffee", "milk"])
+
+        self.latte.recipe = [
+            {"name": "Coffee", "color": "brown", "parts": 1},
+            {"name": " Steamed   Milk ", "color": "white", "parts": 2},
+            {"name": "coffee", "color": "brown", "parts": 1},
+        ]
+        db.session.commit()
+        self.assertEqual(self.ingredient_names(self.latte), ["coffee", "steamed milk"])
+
+        self.latte.recipe = json.dumps([{"name": "foam", "color": "beige", "parts": 1}])
+        self.latte.update()
+        self.assertEqual(self.ingredient_names(self.latte), ["foam"])
+        self.assertEqual(self.ingredient_names(self.water), ["water"])
+
+        self.latte.delete()
+        self.assertEqual(DrinkIngredient.query.filter_by(name="foam").count(), 0)
+
+    def test_with_ingredient(self):
+        """ Test if drinks are found by ingredient, ignoring case and spacing """
+        mocha = Drink(
+            title="Mocha",
+            recipe=[
+                {"name": "chocolate", "color": "brown", "parts": 1},
+                {"name": "Milk", "color": "white", "parts": 1},
+            ],
+        )
+        mocha.insert()
+
+        def titles(name):
+            drinks = Drink.with_ingredient(name).order_by(Drink.id)
+            return [drink.title for drink in drinks]
+
+        self.assertEqual(titles("milk"), ["Latte", "Mocha"])
+        self.assertEqual(titles("  MILK "), ["Latte", "Mocha"])
+        self.assertEqual(titles("chocolate"), ["Mocha"])
+        self.assertEqual(titles("tea"), [])
+
+    def test_long_ingredient_names_are_indexed(self):
+        """ Test if ingredient names longer than the title column are indexed """
+        name = "single origin " * 20
+        drink = Drink(
+            title="Pour Over", recipe=[{"name": name, "color": "brown", "parts": 1}]
+        )
+        drink.insert()
+
+        self.assertEqual([d.title for d in Drink.with_ingredient(name)], ["Pour Over"])
+        self.assertEqual(DrinkIngredient.__table__.c.name.type.length, None)
+
+
+class MigrateRecipesTestCase(unittest.TestCase):
+    """This class represents the recipe migration test case"""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        path = os.path.join(self.directory.name, "legacy.db")
+        self.engine = create_engine("sqlite:///" + path)
+        # The schema and rows of the database.db shipped with the starter code.
+        with self.engine.begin() as connection:
+            connection.execute(
+                text(
+                    "CREATE TABLE drink (id INTEGER NOT NULL, title VARCHAR(80), "
+                    "recipe VARCHAR(180) NOT NULL, PRIMARY KEY (id), UNIQUE (title))"
+                )
+            )
+            connection.execute(
+                text(
+                    "INSERT INTO drink (id, title, recipe) VALUES (:id, :title, :recipe)"
+                ),
+                [
+                    {
+                        "id": 1,
+                        "title": "Latte",
+                        "recipe": '[{"name": "coffee", "color": "brown", "parts": 1},'
+                        ' {"name": "Milk", "color": "white", "parts": 3}]',
+                    },
+                    {
+                        "id": 2,
+                        "title": "Water",
+                        "recipe": '[{"name": "water", "color": "blue", "parts": 1}]',
+                    },
+                ],
+            )
+
+    def tearDown(self):
+        self.engine.dispose()
+        self.directory.cleanup()
+
+    def migrate(self):
+        with contextlib.redirect_stdout(io.StringIO()) as output:
+            migrate(self.engine)
+        return output.getvalue()
+
+    def snapshot(self):
+        with self.engine.connect() as connection:
+            drinks = connection.execute(
+                text("SELECT id, title, recipe FROM drink ORDER BY id")
+            ).fetchall()
+            ingredients = connection.execute(
+                text(
+                    "SELECT drink_id, name FROM drink_ingredient ORDER BY drink_id, name"
+                )
+            ).fetchall()
+        columns = inspect(self.engine).get_columns("drink")
+        recipe_type = next(c["type"] for c in columns if c["name"] == "recipe")
+        return drinks, ingredients, type(recipe_type)
+
+    def test_migration_converts_recipes_and_indexes_ingredients(self):
+        """ Test if recipes become JSON and their ingredients are indexed """
+        self.assertIn("Converting drink.recipe to JSON", self.migrate())
+        drinks, ingredients, recipe_type = self.snapshot()
+
+        self.assertTrue(issubclass(recipe_type, JSON))
+        self.assertEqual(
+            [(d.id, d.title) for d in drinks], [(1, "Latte"), (2, "Water")]
+        )
+        self.assertEqual(
+            [tuple(row) for row in ingredients],
+            [(1, "coffee"), (1, "milk"), (2, "water")],
+        )
+
+    def test_migration_is_idempotent(self):
+        """ Test if migrating again changes nothing """
+        self.migrate()
+        migrated = self.snapshot()
+
+        self.assertNotIn("Converting", self.migrate())
+        self.assertEqual(self.snapshot(), migrated)
+
+    def test_invalid_recipes_stop_the_migration(self):
+        """ Test if nothing is changed when a recipe is not valid JSON """
+        with self.engine.begin() as connection:
+            connection.execute(text("UPDATE drink SET recipe = '[{' WHERE id = 2"))
+
+        with self.assertRaises(SystemExit):
+            self.migrate()
+        self.assertEqual(inspect(self.engine).get_table_names(), ["drink"])
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()